@@ -0,0 +1,170 @@
+import heapq
+import sys
+import threading
+import time
+from collections import deque
+
+from database import get_db_connection
+
+# Rows kept in the dashboard's "recent" tables and genres in its chart
+RECENT_SIZE = 10
+TOP_GENRES = 5
+
+COUNTERS = ('users', 'interactions', 'watch_seconds')
+
+class DashboardAggregates:
+    """Totals and recent activity for /api/admin/summary, maintained on write.
+
+    Counters live in `dashboard_counters` and per-genre watch counts in
+    `genre_watch_counts`; write paths update both inside the event's own
+    transaction. An in-memory mirror plus two fixed-size ring buffers of
+    recent events mean summary() never touches SQLite. The record_* methods
+    return the mirror update for the caller to run after its commit;
+    updates recorded before a load() are skipped, as in
+    profiles.GenreProfileStore.
+    """
+
+    def __init__(self):
+        self._counters = dict.fromkeys(COUNTERS, 0)
+        self._genres = {}
+        self._recent_searches = deque(maxlen=RECENT_SIZE)
+        self._recent_interactions = deque(maxlen=RECENT_SIZE)
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.loaded = False
+
+    def load(self, conn):
+        """Replace the mirror with the stored aggregates (left unloaded if the tables are missing)."""
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='dashboard_counters'").fetchone():
+            return
+        counters = dict.fromkeys(COUNTERS, 0)
+        counters.update(conn.execute('SELECT name, value FROM dashboard_counters').fetchall())
+        genres = dict(conn.execute('SELECT genre, count FROM genre_watch_counts').fetchall())
+        searches = conn.execute('''
+            SELECT s.query, s.timestamp, u.username
+            FROM search_history s JOIN users u ON s.user_id = u.id
+            ORDER BY s.timestamp DESC, s.id DESC LIMIT ?
+        ''', (RECENT_SIZE,)).fetchall()
+        interactions = conn.execute('''
+            SELECT i.interaction_type, i.timestamp, u.username, m.title
+            FROM interactions i
+            JOIN users u ON i.user_id = u.id
+            JOIN movies m ON i.movie_id = m.id
+            ORDER BY i.timestamp DESC, i.id DESC LIMIT ?
+        ''', (RECENT_SIZE,)).fetchall()
+        with self._lock:
+            self._counters = counters
+            self._genres = genres
+            # Ring buffers hold oldest first; summary() reverses them
+            self._recent_searches = deque((dict(row) for row in reversed(searches)), maxlen=RECENT_SIZE)
+            self._recent_interactions = deque((dict(row) for row in reversed(interactions)), maxlen=RECENT_SIZE)
+            self._generation += 1
+        self.loaded = True
+
+    def record_user(self, conn):
+        return self._add(conn, {'users': 1}, {})
+
+    def record_interaction(self, conn, user_id, movie_id, interaction_type, watch_time=0):
+        counters = {'interactions': 1}
+        genres = {}
+        movie = conn.execute('SELECT title, genre FROM movies WHERE id = ?', (movie_id,)).fetchone()
+        if interaction_type == 'watch':
+            counters['watch_seconds'] = watch_time or 0
+            if movie is not None:
+                # A movie counts once for each distinct genre it is tagged with
+                genres = dict.fromkeys(set(movie['genre'].split('|')), 1)
+        add = self._add(conn, counters, genres)
+        user = conn.execute('SELECT username FROM users WHERE id = ?', (user_id,)).fetchone()
+        generation = self._generation
+
+        def apply():
+            add()
+            if user is not None and movie is not None:
+                with self._lock:
+                    if generation != self._generation:
+                        return
+                    self._recent_interactions.append({'interaction_type': interaction_type, 'timestamp': _now(),
+                                                      'username': user['username'], 'title': movie['title']})
+        return apply
+
+    def record_search(self, conn, user_id, query):
+        user = conn.execute('SELECT username FROM users WHERE id = ?', (user_id,)).fetchone()
+        generation = self._generation
+
+        def apply():
+            if user is not None:
+                with self._lock:
+                    if generation != self._generation:
+                        return
+                    self._recent_searches.append({'query': query, 'timestamp': _now(),
+                                                  'username': user['username']})
+        return apply
+
+    def _add(self, conn, counters, genres):
+        conn.executemany('''
+            INSERT INTO dashboard_counters (name, value) VALUES (?, ?)
+            ON CONFLICT (name) DO UPDATE SET value = value + excluded.value
+        ''', list(counters.items()))
+        conn.executemany('''
+            INSERT INTO genre_watch_counts (genre, count) VALUES (?, ?)
+            ON CONFLICT (genre) DO UPDATE SET count = count + excluded.count
+        ''', list(genres.items()))
+        generation = self._generation
+
+        def apply():
+            with self._lock:
+                if generation != self._generation:
+                    return
+                for name, delta in counters.items():
+                    self._counters[name] = self._counters.get(name, 0) + delta
+                for genre, delta in genres.items():
+                    self._genres[genre] = self._genres.get(genre, 0) + delta
+        return apply
+
+    def summary(self):
+        with self._lock:
+            watch_seconds = self._counters['watch_seconds']
+            # Most watched first, ties by name
+            top_genres = heapq.nsmallest(TOP_GENRES, self._genres.items(), key=lambda item: (-item[1], item[0]))
+            return {
+                'total_users': self._counters['users'],
+                'total_interactions': self._counters['interactions'],
+                'total_watch_time': round(watch_seconds / 60, 1) if watch_seconds else 0,
+                'recent_searches': [dict(row) for row in reversed(self._recent_searches)],
+                'recent_interactions': [dict(row) for row in reversed(self._recent_interactions)],
+                'top_genres': [{'genre': genre, 'count': count} for genre, count in top_genres],
+            }
+
+def _now():
+    # Same format and clock (UTC) as SQLite's CURRENT_TIMESTAMP
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+
+def backfill(conn):
+    """Recompute the stored counters and genre counts from scratch. Caller commits."""
+    conn.execute('DELETE FROM dashboard_counters')
+    conn.execute('DELETE FROM genre_watch_counts')
+    conn.execute('''
+        INSERT INTO dashboard_counters (name, value)
+        SELECT 'users', COUNT(*) FROM users
+        UNION ALL SELECT 'interactions', COUNT(*) FROM interactions
+        UNION ALL SELECT 'watch_seconds', COALESCE(SUM(watch_time), 0) FROM interactions
+                  WHERE interaction_type = 'watch'
+    ''')
+    counts = {}
+    for genre, count in conn.execute('''
+            SELECT m.genre, COUNT(*) FROM interactions i JOIN movies m ON i.movie_id = m.id
+            WHERE i.interaction_type = 'watch' GROUP BY m.genre'''):
+        for g in set(genre.split('|')):
+            counts[g] = counts.get(g, 0) + count
+    conn.executemany('INSERT INTO genre_watch_counts (genre, count) VALUES (?, ?)', counts.items())
+
+if __name__ == '__main__':
+    # python aggregates.py backfill
+    if sys.argv[1:] != ['backfill']:
+        print('usage: python aggregates.py backfill')
+        sys.exit(1)
+    conn = get_db_connection()
+    backfill(conn)
+    conn.commit()
+    conn.close()
+    print("Rebuilt dashboard aggregates.")
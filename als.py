@@ -0,0 +1,268 @@
+"""Implicit-feedback matrix factorization (alternating least squares).
+
+Every (user, movie) pair with positive interactions gets a preference of
+1 and a confidence of 1 + ALPHA * weight, where the weight sums the pair's
+likes and watch time (dislikes count for nothing). Training alternates
+between solving all user factors with the item factors fixed and the
+other way round. Rows are solved in blocks of bounded size, so each
+worker's memory per iteration is fixed, on a pool of threads (the NumPy
+and sparse kernels release the GIL).
+
+    python als.py train [--factors 32] [--iterations 10] [--threads 4]
+
+writes the factors to <snapshot dir>/als_factors.npz, where the server
+picks them up on its next model refresh.
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy import sparse
+
+from profiles import LIKE_POINTS, MAX_WATCH_POINTS, WATCH_POINTS_PER_MINUTE
+
+FACTORS = 32
+ITERATIONS = 10
+REGULARIZATION = 0.1
+# Confidence gained per unit of interaction weight
+ALPHA = 10.0
+THREADS = min(4, os.cpu_count() or 1)
+# Upper bounds per solved block: rows, and stored entries (each entry
+# materializes a factors x factors outer product while the block is solved)
+BLOCK_ROWS = 1024
+BLOCK_NNZ = 4096
+# Items scored per block when serving (users x SCORE_BLOCK scores at a time)
+SCORE_BLOCK = 4096
+FACTORS_FILE = 'als_factors.npz'
+
+class Factors:
+    """Trained user and item factors with the ids their rows belong to."""
+
+    def __init__(self, user_factors, item_factors, user_ids, movie_ids, meta=None):
+        self.user_factors = user_factors
+        self.item_factors = item_factors
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        self.movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        self.meta = meta or {}
+        self.user_rows = {int(u): i for i, u in enumerate(self.user_ids)}
+
+    @property
+    def interaction_watermark(self):
+        return self.meta.get('interaction_watermark', 0)
+
+    @property
+    def regularization(self):
+        return self.meta.get('regularization', REGULARIZATION)
+
+    @property
+    def alpha(self):
+        return self.meta.get('alpha', ALPHA)
+
+    def aligned_items(self, movie_ids):
+        """Item factors in the row order of movie_ids; movies trained without get zero vectors."""
+        rows = {int(m): i for i, m in enumerate(self.movie_ids)}
+        out = np.zeros((len(movie_ids), self.item_factors.shape[1]), dtype=self.item_factors.dtype)
+        for i, movie_id in enumerate(movie_ids):
+            j = rows.get(int(movie_id))
+            if j is not None:
+                out[i] = self.item_factors[j]
+        return out
+
+def interaction_weights(interactions):
+    """Per-event weight: 1 for a watch or like plus its profile points (profiles.interaction_points) in likes."""
+    kinds = interactions['interaction_type'].to_numpy()
+    minutes = interactions['watch_time'].fillna(0).to_numpy(dtype=np.float64) / 60
+    watch_points = np.where(minutes > 1, np.minimum(np.trunc(minutes * WATCH_POINTS_PER_MINUTE), MAX_WATCH_POINTS), 0)
+    points = np.where(kinds == 'like', LIKE_POINTS, np.where(kinds == 'watch', watch_points, 0))
+    return np.where(kinds == 'dislike', 0.0, 1.0 + points / LIKE_POINTS)
+
+def confidence_matrix(interactions, user_rows, row_lookup, n_items, alpha=ALPHA):
+    """CSR users x items of ALPHA * summed weight (the confidence above 1) for known users and movies."""
+    if interactions.empty:
+        return sparse.csr_matrix((len(user_rows), n_items))
+    movie_ids = interactions['movie_id'].to_numpy(dtype=np.int64)
+    cols = np.full(len(movie_ids), -1, dtype=np.int64)
+    in_range = (movie_ids >= 0) & (movie_ids < len(row_lookup))
+    cols[in_range] = row_lookup[movie_ids[in_range]]
+    rows = np.array([user_rows.get(int(u), -1) for u in interactions['user_id']], dtype=np.int64)
+    weights = interaction_weights(interactions)
+    keep = (cols >= 0) & (rows >= 0) & (weights > 0)
+    # Duplicate pairs are summed
+    matrix = sparse.csr_matrix((alpha * weights[keep], (rows[keep], cols[keep])), shape=(len(user_rows), n_items))
+    matrix.sum_duplicates()
+    return matrix
+
+def blocks(matrix, max_rows=BLOCK_ROWS, max_nnz=BLOCK_NNZ):
+    """(start, stop) row ranges with at most max_rows rows and, past their first row, max_nnz entries."""
+    indptr = matrix.indptr
+    start = 0
+    n = matrix.shape[0]
+    while start < n:
+        # Furthest stop whose entries still fit, but always at least one row
+        stop = int(np.searchsorted(indptr, indptr[start] + max_nnz, side='right')) - 1
+        stop = min(max(stop, start + 1), start + max_rows, n)
+        yield start, stop
+        start = stop
+
+def solve_block(confidence, fixed, gram, regularization):
+    """Least-squares factors for every row of a confidence block, given the other side's factors.
+
+    Row u solves (G + Y^T C'_u Y + reg I) x = Y^T (1 + C'_u) p_u, where G is
+    fixed^T fixed and C'_u the row's confidence above 1.
+    """
+    n_rows, k = confidence.shape[0], fixed.shape[1]
+    if n_rows == 1:
+        # A lone row may be any length: weight the factors instead of forming outer products
+        sub = fixed[confidence.indices]
+        lhs = (sub.T * confidence.data) @ sub + gram + regularization * np.eye(k)
+        return np.linalg.solve(lhs, sub.T @ (confidence.data + 1.0))[None, :]
+    cols, remapped = np.unique(confidence.indices, return_inverse=True)
+    local = sparse.csr_matrix((confidence.data, remapped, confidence.indptr), shape=(n_rows, len(cols)))
+    sub = fixed[cols]
+    outer = (sub[:, :, None] * sub[:, None, :]).reshape(len(cols), k * k)
+    lhs = (local @ outer).reshape(n_rows, k, k) + gram + regularization * np.eye(k)
+    preference = local.copy()
+    preference.data = preference.data + 1.0
+    rhs = preference @ sub
+    return np.linalg.solve(lhs, rhs[:, :, None])[:, :, 0]
+
+def _solve_all(confidence, fixed, regularization, pool, out):
+    gram = fixed.T @ fixed
+    ranges = list(blocks(confidence))
+
+    def solve(bounds):
+        start, stop = bounds
+        out[start:stop] = solve_block(confidence[start:stop], fixed, gram, regularization)
+
+    for _ in pool.map(solve, ranges):
+        pass
+
+def train(confidence, factors=FACTORS, iterations=ITERATIONS, regularization=REGULARIZATION,
+          threads=THREADS, seed=7, log=None):
+    """(user factors, item factors) for a users x items confidence matrix (see confidence_matrix)."""
+    rng = np.random.default_rng(seed)
+    confidence = sparse.csr_matrix(confidence, dtype=np.float64)
+    by_item = confidence.T.tocsr()
+    users = np.zeros((confidence.shape[0], factors))
+    items = rng.normal(scale=0.01, size=(confidence.shape[1], factors))
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for iteration in range(iterations):
+            start = time.perf_counter()
+            _solve_all(confidence, items, regularization, pool, users)
+            _solve_all(by_item, users, regularization, pool, items)
+            if log:
+                log(f"iteration {iteration + 1}/{iterations}: {time.perf_counter() - start:.2f}s")
+    return users, items
+
+def fold_in(confidence, item_factors, regularization=REGULARIZATION, gram=None):
+    """User factors for confidence rows against fixed item factors: the user half of one ALS step."""
+    if gram is None:
+        gram = item_factors.T @ item_factors
+    out = np.zeros((confidence.shape[0], item_factors.shape[1]))
+    for start, stop in blocks(confidence):
+        out[start:stop] = solve_block(confidence[start:stop], item_factors, gram, regularization)
+    return out
+
+def top_k(user_vectors, item_factors, top_n, exclude=None, block_size=SCORE_BLOCK):
+    """(rows, scores) of the top_n items by dot product for each user vector, best first.
+
+    Items are scored block by block and only each block's partial top-K is
+    kept, so memory stays at users x block_size. exclude is an optional
+    users x items sparse matrix whose stored entries are never returned;
+    slots that could not be filled hold row -1 and score -inf.
+    """
+    user_vectors = np.atleast_2d(user_vectors)
+    n_users, n_items = user_vectors.shape[0], item_factors.shape[0]
+    best_rows = np.full((n_users, 0), -1, dtype=np.int64)
+    best_scores = np.full((n_users, 0), -np.inf)
+    if exclude is not None:
+        exclude = sparse.csr_matrix(exclude)
+    for start in range(0, n_items, block_size):
+        stop = min(start + block_size, n_items)
+        scores = user_vectors @ item_factors[start:stop].T
+        if exclude is not None:
+            users, cols = exclude[:, start:stop].nonzero()
+            scores[users, cols] = -np.inf
+        rows = np.broadcast_to(np.arange(start, stop), scores.shape)
+        scores = np.concatenate([best_scores, scores], axis=1)
+        rows = np.concatenate([best_rows, rows], axis=1)
+        if scores.shape[1] > top_n:
+            keep = np.argpartition(-scores, top_n - 1, axis=1)[:, :top_n]
+            scores = np.take_along_axis(scores, keep, axis=1)
+            rows = np.take_along_axis(rows, keep, axis=1)
+        best_scores, best_rows = scores, rows
+    # Best first; equal scores by catalog row
+    order = np.lexsort((best_rows, -best_scores), axis=1) if best_rows.size else best_rows
+    best_rows = np.take_along_axis(best_rows, order, axis=1)
+    best_scores = np.take_along_axis(best_scores, order, axis=1)
+    best_rows[np.isneginf(best_scores)] = -1
+    return best_rows, best_scores
+
+def save(factors, path):
+    """Write factors to path atomically (a temporary file renamed over it)."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    staging = f'{path}.{os.getpid()}.tmp.npz'
+    np.savez(staging, user_factors=factors.user_factors, item_factors=factors.item_factors,
+             user_ids=factors.user_ids, movie_ids=factors.movie_ids, meta=np.array(json.dumps(factors.meta)))
+    os.replace(staging, path)
+
+def load(path):
+    """Factors saved at path, or None if there are none."""
+    try:
+        with np.load(path) as data:
+            return Factors(data['user_factors'], data['item_factors'], data['user_ids'], data['movie_ids'],
+                           json.loads(str(data['meta'])))
+    except FileNotFoundError:
+        return None
+
+def fit(model, factors=FACTORS, iterations=ITERATIONS, regularization=REGULARIZATION, alpha=ALPHA,
+        threads=THREADS, seed=7, log=None):
+    """Factors trained on a RecommenderModel's interactions, over its users and catalog."""
+    user_ids = sorted(int(u) for u in model.interactions['user_id'].unique())
+    user_rows = {u: i for i, u in enumerate(user_ids)}
+    confidence = confidence_matrix(model.interactions, user_rows, model.row_lookup, len(model.movie_ids), alpha)
+    users, items = train(confidence, factors, iterations, regularization, threads, seed, log)
+    meta = {
+        'trained_at': time.time(),
+        'factors': factors,
+        'iterations': iterations,
+        'regularization': regularization,
+        'alpha': alpha,
+        'interaction_watermark': model.interaction_watermark,
+        'nnz': int(confidence.nnz),
+    }
+    return Factors(users, items, user_ids, model.movie_ids, meta)
+
+if __name__ == '__main__':
+    from database import get_db_connection, migrate
+    from recommender import Recommender
+    from snapshot import DEFAULT_DIR
+
+    parser = argparse.ArgumentParser(description='Train implicit ALS factors from the database.')
+    parser.add_argument('command', choices=['train', 'info'])
+    parser.add_argument('--dir', default=DEFAULT_DIR)
+    parser.add_argument('--factors', type=int, default=FACTORS)
+    parser.add_argument('--iterations', type=int, default=ITERATIONS)
+    parser.add_argument('--regularization', type=float, default=REGULARIZATION)
+    parser.add_argument('--alpha', type=float, default=ALPHA)
+    parser.add_argument('--threads', type=int, default=THREADS)
+    args = parser.parse_args()
+    path = os.path.join(args.dir, FACTORS_FILE)
+
+    if args.command == 'train':
+        start = time.perf_counter()
+        conn = get_db_connection()
+        migrate(conn)
+        conn.close()
+        rec = Recommender(snapshot_dir=args.dir)
+        trained = fit(rec.model, args.factors, args.iterations, args.regularization, args.alpha, args.threads,
+                      log=print)
+        save(trained, path)
+        print(f"Trained {len(trained.user_ids)} users x {len(trained.movie_ids)} movies "
+              f"in {time.perf_counter() - start:.1f}s -> {path}")
+    else:
+        trained = load(path)
+        print(f"No factors at {path}" if trained is None else json.dumps(trained.meta, indent=2))
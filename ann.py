@@ -0,0 +1,159 @@
+"""Approximate nearest-neighbor search over item vectors (inverted file index).
+
+Vectors are unit length, so a dot product is a cosine similarity. k-means
+splits them into n_lists clusters; a query scores the centroids, then only
+the items in its nprobe closest lists. With the default sqrt(N) lists a
+query touches about nprobe * sqrt(N) items instead of N. Raising nprobe
+trades latency for recall (nprobe = n_lists is exact search).
+
+Content vectors are TF-IDF rows reduced by truncated SVD; learned ALS item
+factors work the same way. See benchmarks/ann_recall.py for recall@K
+against exact search.
+"""
+import copy
+
+import numpy as np
+from sklearn.decomposition import TruncatedSVD
+
+# SVD dimensions kept from the TF-IDF matrix
+DIMS = 64
+NPROBE = 8
+KMEANS_ITERATIONS = 10
+# k-means is fit on at most this many vectors; all are then assigned
+TRAIN_SAMPLE = 50000
+# Vectors scored against the centroids per block while assigning
+ASSIGN_BLOCK = 4096
+
+def default_lists(n):
+    return max(1, int(np.sqrt(n)))
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+def reduce(tfidf_matrix, dims=DIMS, seed=7):
+    """(unit vectors, fitted SVD) for TF-IDF rows; new rows are projected with project()."""
+    dims = max(1, min(dims, tfidf_matrix.shape[1] - 1, tfidf_matrix.shape[0] - 1))
+    svd = TruncatedSVD(n_components=dims, random_state=seed)
+    return normalize(svd.fit_transform(tfidf_matrix)), svd
+
+def project(svd, tfidf_rows):
+    return normalize(svd.transform(tfidf_rows))
+
+def assign(vectors, centroids, block_size=ASSIGN_BLOCK):
+    """Closest (highest dot product) centroid of every vector, scored block by block."""
+    out = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), block_size):
+        out[start:start + block_size] = np.argmax(vectors[start:start + block_size] @ centroids.T, axis=1)
+    return out
+
+def kmeans(vectors, k, iterations=KMEANS_ITERATIONS, sample=TRAIN_SAMPLE, seed=7):
+    """Unit-length centroids of spherical k-means over (a sample of) vectors."""
+    rng = np.random.default_rng(seed)
+    if len(vectors) > sample:
+        vectors = vectors[rng.choice(len(vectors), sample, replace=False)]
+    k = min(k, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = assign(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        # An emptied cluster restarts from a random vector
+        empty = np.flatnonzero(np.bincount(labels, minlength=k) == 0)
+        sums[empty] = vectors[rng.choice(len(vectors), len(empty))]
+        centroids = normalize(sums)
+    return centroids
+
+def exact_search(vectors, query, k, exclude=()):
+    """(rows, scores) of the k vectors closest to query by brute force, best first."""
+    scores = vectors @ query
+    scores[np.asarray(exclude, dtype=np.int64)] = -np.inf
+    k = min(k, int(np.isfinite(scores).sum()))
+    top = np.argpartition(-scores, k - 1)[:k] if 0 < k < len(scores) else np.flatnonzero(np.isfinite(scores))
+    top = top[np.lexsort((top, -scores[top]))]
+    return top, scores[top]
+
+class IVFIndex:
+    """Inverted file index: item rows grouped by nearest k-means centroid.
+
+    Each list keeps its rows and their vectors side by side, so a query
+    scores every probed list with one contiguous matrix-vector product.
+    Rows are numbered in insertion order. add() places new vectors in
+    their nearest existing list without refitting the centroids, so recall
+    slowly degrades as the catalog drifts; rebuild once many rows were added.
+    """
+
+    def __init__(self, centroids, nprobe=NPROBE):
+        self.centroids = centroids
+        self.nprobe = nprobe
+        self.lists = [np.empty(0, dtype=np.int64) for _ in range(len(centroids))]
+        self.list_vectors = [np.empty((0, centroids.shape[1]), dtype=np.float32) for _ in range(len(centroids))]
+        # List and position within it of every row
+        self.row_list = np.empty(0, dtype=np.int64)
+        self.row_offset = np.empty(0, dtype=np.int64)
+        # Rows added since the centroids were fit
+        self.added = 0
+
+    @classmethod
+    def build(cls, vectors, n_lists=None, nprobe=NPROBE, iterations=KMEANS_ITERATIONS, seed=7):
+        vectors = normalize(vectors)
+        n_lists = n_lists or default_lists(len(vectors))
+        index = cls(kmeans(vectors, n_lists, iterations, seed=seed), nprobe)
+        index.add(vectors)
+        index.added = 0
+        return index
+
+    def __len__(self):
+        return len(self.row_list)
+
+    def copy(self):
+        """Independent copy that can be added to without affecting this index (arrays are never mutated)."""
+        other = copy.copy(self)
+        other.lists = list(self.lists)
+        other.list_vectors = list(self.list_vectors)
+        return other
+
+    def vectors(self, rows):
+        """Stored vectors of rows."""
+        rows = np.asarray(rows, dtype=np.int64)
+        out = np.empty((len(rows), self.centroids.shape[1]), dtype=np.float32)
+        for i, row in enumerate(rows):
+            out[i] = self.list_vectors[self.row_list[row]][self.row_offset[row]]
+        return out
+
+    def add(self, vectors):
+        """Insert vectors (normalized to unit length) into their nearest lists; returns their row numbers."""
+        vectors = normalize(vectors)
+        rows = np.arange(len(self), len(self) + len(vectors))
+        labels = assign(vectors, self.centroids)
+        offsets = np.empty(len(vectors), dtype=np.int64)
+        for label in np.unique(labels):
+            members = labels == label
+            offsets[members] = len(self.lists[label]) + np.arange(members.sum())
+            self.lists[label] = np.concatenate([self.lists[label], rows[members]])
+            self.list_vectors[label] = np.concatenate([self.list_vectors[label], vectors[members]])
+        self.row_list = np.concatenate([self.row_list, labels])
+        self.row_offset = np.concatenate([self.row_offset, offsets])
+        self.added += len(vectors)
+        return rows
+
+    def search(self, query, k, nprobe=None, exclude=()):
+        """(rows, scores) of up to k approximate nearest rows to a query vector, best first."""
+        if not len(self):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        nprobe = min(nprobe or self.nprobe, len(self.lists))
+        query = normalize(query)
+        centroid_scores = self.centroids @ query
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe] if nprobe < len(self.lists) \
+            else np.arange(len(self.lists))
+        candidates = np.concatenate([self.lists[i] for i in probe])
+        scores = np.concatenate([self.list_vectors[i] @ query for i in probe])
+        if len(exclude):
+            scores[np.isin(candidates, exclude)] = -np.inf
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        top = top[np.lexsort((candidates[top], -scores[top]))]
+        return candidates[top], scores[top]
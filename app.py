@@ -1,22 +1,261 @@
-from flask import Flask, render_template, jsonify, request, g
+from flask import Flask, Response, render_template, jsonify, request, g, json, stream_with_context
+import atexit
+import os
+import queue
 import sqlite3
-from database import DB_NAME, get_db_connection
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+import connections
+from database import get_db_connection, migrate
 from recommender import Recommender
+import aggregates
+import als
+import snapshot
+import catalog
+import materialized
+import metrics
+import pagination
+import trending
+from ingest import IngestBuffer, IngestUnavailable
 
 app = Flask(__name__)
-recommender = Recommender()
+
+# Share of route calls and recommender stages timed into the latency
+# histograms behind /api/admin/metrics (1.0 = every call, 0 = off)
+METRICS_SAMPLE_RATE = float(os.environ.get('NETFLIX_REC_METRICS_SAMPLE', metrics.DEFAULT_SAMPLE_RATE))
+metrics.configure(METRICS_SAMPLE_RATE)
+
+# Bring the schema up to date (non-destructive) before loading the model
+_conn = get_db_connection()
+migrate(_conn)
+# Windowed per-movie counts behind /api/trending, updated by write_events
+trending_store = trending.TrendingStore()
+trending_store.load(_conn)
+# Counters and recent-activity rings behind /api/admin/summary
+dashboard = aggregates.DashboardAggregates()
+dashboard.load(_conn)
+_conn.close()
+
+# Content model snapshots (built offline with `python snapshot.py build`)
+# are memory-mapped at startup instead of refitting TF-IDF; a fit made
+# because no snapshot matched is saved for the next start.
+SNAPSHOT_DIR = snapshot.DEFAULT_DIR
+
+# Implicit ALS factors trained offline with `python als.py train`; while the
+# file exists its top items join the hybrid candidate pool
+ALS_FACTORS = os.path.join(SNAPSHOT_DIR, als.FACTORS_FILE)
+
+# Content candidates from an approximate (IVF) index over SVD-reduced TF-IDF
+# vectors, probing ANN_NPROBE lists per query, instead of scoring the whole
+# catalog. Worth enabling for catalogs of a few hundred thousand titles;
+# None keeps exact scoring.
+ANN_NPROBE = None
+
+recommender = Recommender(snapshot_dir=SNAPSHOT_DIR, save_snapshots=True, als_path=ALS_FACTORS,
+                          ann_nprobe=ANN_NPROBE)
+
+# Serve /api/recommendations/<user_id> from the user_recommendations table
+# while entries are fresh; stale users are recomputed by RecomputeWorker.
+MATERIALIZE_RECOMMENDATIONS = True
+MATERIALIZED_MAX_AGE = materialized.DEFAULT_MAX_AGE
+RECOMPUTE_INTERVAL = 5.0
+
+# Rebuild the model on a background thread instead of on the request path:
+# every REBUILD_INTERVAL seconds a new version is built once at least
+# REBUILD_MIN_EVENTS events (or a catalog change) are pending, then swapped
+# in atomically. Requests keep serving the active version meanwhile.
+BACKGROUND_REBUILD = True
+REBUILD_INTERVAL = 10.0
+REBUILD_MIN_EVENTS = 1
+
+# Per-route response cache settings: entries live for `ttl` seconds and each
+# route keeps at most `max_size` of them (least recently used evicted first).
+# A ttl of 0 disables caching for that route.
+CACHE_CONFIG = {
+    'trending': {'ttl': 30, 'max_size': 8},
+    'movies': {'ttl': 300, 'max_size': 64},
+    'movie': {'ttl': 300, 'max_size': 2048},
+    'users': {'ttl': 60, 'max_size': 4},
+    'interests': {'ttl': 300, 'max_size': 4096},
+    'history': {'ttl': 300, 'max_size': 4096},
+}
+# Invalidation counters per route: users hash into this many slots, so
+# memory stays bounded (a collision only skips caching one response)
+CACHE_GENERATION_SLOTS = 4096
+
+class ResponseCache:
+    """Bounded per-route LRU cache of successful JSON responses with TTL expiry.
+
+    Per-user entries are indexed by user id so write endpoints can drop
+    exactly the entries an event affects. Every invalidation also bumps a
+    generation counter; a response is only stored if no invalidation for
+    its user happened while the view ran, so a read that raced a write
+    cannot put the pre-write response back.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self._entries = {route: OrderedDict() for route in config}
+        self._by_user = {route: {} for route in config}
+        self._stats = {route: {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0, 'skipped_sets': 0}
+                       for route in config}
+        # Per route: [route-wide generation, per-user-slot generations]
+        self._generations = {route: [0, [0] * CACHE_GENERATION_SLOTS] for route in config}
+        self._lock = threading.Lock()
+
+    def cached(self, route, user_arg=None):
+        """Decorator for a view; user_arg names the view argument holding the user id."""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.config[route]['ttl']:
+                    return view(*args, **kwargs)
+                user_id = kwargs.get(user_arg) if user_arg else None
+                key = (user_id, tuple(sorted(kwargs.items())), tuple(sorted(request.args.items(multi=True))))
+                hit = self._get(route, key)
+                if hit is not None:
+                    body, status, mimetype, headers = hit
+                    return app.response_class(body, status=status, mimetype=mimetype, headers=headers)
+                generation = self._generation(route, user_id)
+                resp = app.make_response(view(*args, **kwargs))
+                if resp.status_code == 200 and not resp.is_streamed:
+                    # Custom X- headers (e.g. X-Next-Cursor) are part of the cached response
+                    headers = [(k, v) for k, v in resp.headers.items() if k.startswith('X-')]
+                    self._set(route, key, user_id, (resp.get_data(), resp.status_code, resp.mimetype, headers),
+                              generation)
+                return resp
+            return wrapper
+        return decorator
+
+    def _get(self, route, key):
+        with self._lock:
+            entries = self._entries[route]
+            entry = entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(route, key)
+                self._stats[route]['misses'] += 1
+                return None
+            entries.move_to_end(key)
+            self._stats[route]['hits'] += 1
+            return entry[1]
+
+    def _generation(self, route, user_id):
+        with self._lock:
+            return self._generation_locked(route, user_id)
+
+    def _generation_locked(self, route, user_id):
+        route_generation, slots = self._generations[route]
+        return route_generation, None if user_id is None else slots[hash(int(user_id)) % len(slots)]
+
+    def _set(self, route, key, user_id, value, generation):
+        with self._lock:
+            if self._generation_locked(route, user_id) != generation:
+                # Invalidated while the view ran: the response may predate the write
+                self._stats[route]['skipped_sets'] += 1
+                return
+            entries = self._entries[route]
+            entries[key] = (time.monotonic() + self.config[route]['ttl'], value, user_id)
+            entries.move_to_end(key)
+            self._by_user[route].setdefault(user_id, set()).add(key)
+            while len(entries) > self.config[route]['max_size']:
+                self._remove(route, next(iter(entries)))
+                self._stats[route]['evictions'] += 1
+
+    def _remove(self, route, key):
+        _, _, user_id = self._entries[route].pop(key)
+        keys = self._by_user[route].get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[route][user_id]
+
+    def invalidate(self, route, user_id=None):
+        """Drop one user's entries for a route, or every entry of the route if user_id is None."""
+        with self._lock:
+            generations = self._generations[route]
+            if user_id is None:
+                generations[0] += 1
+                keys = list(self._entries[route])
+            else:
+                slots = generations[1]
+                slots[hash(int(user_id)) % len(slots)] += 1
+                keys = list(self._by_user[route].get(int(user_id), ()))
+            for key in keys:
+                self._remove(route, key)
+            self._stats[route]['invalidations'] += len(keys)
+
+    def stats(self):
+        with self._lock:
+            return {route: dict(self._stats[route], size=len(self._entries[route]), **self.config[route])
+                    for route in self.config}
+
+cache = ResponseCache(CACHE_CONFIG)
+
+# Write-behind ingestion for /api/interact and /api/track/search. When
+# enabled, events are queued and written in batches by a background thread
+# (see ingest.py for the durability modes); when disabled every request
+# commits its own event.
+INGEST_BUFFER = False
+INGEST_CONFIG = {
+    'max_queue': 10000,
+    'flush_size': 500,
+    'flush_interval': 0.2,
+    'durability': 'buffered',
+}
+ingest_buffer = None
+
+# Upper bounds on user_ids and top_n accepted by one /api/recommendations/batch call
+MAX_BATCH_USERS = 5000
+MAX_TOP_N = 100
 
 def get_db():
+    """Pooled writer connection for this request (write endpoints only)."""
     db = getattr(g, '_database', None)
     if db is None:
-        db = g._database = get_db_connection()
+        db = g._database = connections.get_manager().writers.acquire()
     return db
 
+def get_read_db():
+    """Pooled read-only connection for this request."""
+    db = getattr(g, '_read_database', None)
+    if db is None:
+        db = g._read_database = connections.get_manager().readers.acquire()
+    return db
+
+@app.before_request
+def start_route_timer():
+    if metrics.registry.sampled():
+        g.metrics_started = time.perf_counter()
+
+@app.after_request
+def add_model_version(response):
+    # Lets clients and logs tell which model version served a request
+    response.headers['X-Model-Version'] = str(recommender.model_version)
+    return response
+
+@app.after_request
+def record_route_metrics(response):
+    # Labelled by the route pattern, not the path, to keep label values bounded
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.registry.inc('http_requests_total', route=route, method=request.method,
+                         status=response.status_code)
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        metrics.registry.histogram('http_request_duration_seconds', route=route, method=request.method) \
+            .observe(time.perf_counter() - started)
+    return response
+
 @app.teardown_appcontext
 def close_connection(exception):
-    db = getattr(g, '_database', None)
+    db = g.pop('_database', None)
+    if db is not None:
+        connections.get_manager().writers.release(db)
+    db = g.pop('_read_database', None)
     if db is not None:
-        db.close()
+        connections.get_manager().readers.release(db)
 
 @app.route('/')
 def index():
@@ -36,84 +275,150 @@ def backend_dashboard():
 
 @app.route('/api/admin/summary')
 def admin_summary():
-    db = get_db()
-    
-    # Total Users
-    cur = db.execute('SELECT COUNT(*) FROM users')
-    total_users = cur.fetchone()[0]
-    
-    # Total Interactions
-    cur = db.execute('SELECT COUNT(*) FROM interactions')
-    total_interactions = cur.fetchone()[0]
-    
-    # Total Watch Time (minutes)
-    cur = db.execute('SELECT SUM(watch_time) FROM interactions WHERE interaction_type="watch"')
-    res = cur.fetchone()[0]
-    total_watch_time = round(res / 60, 1) if res else 0
-
-    # Recent Searches
-    cur = db.execute('SELECT s.query, s.timestamp, u.username FROM search_history s JOIN users u ON s.user_id = u.id ORDER BY s.timestamp DESC LIMIT 10')
-    recent_searches = [dict(row) for row in cur.fetchall()]
-    
-    # Recent Interactions
-    cur = db.execute('''
-        SELECT i.interaction_type, i.timestamp, u.username, m.title 
-        FROM interactions i 
-        JOIN users u ON i.user_id = u.id 
-        JOIN movies m ON i.movie_id = m.id 
-        ORDER BY i.timestamp DESC 
-        LIMIT 10
-    ''')
-    recent_interactions = [dict(row) for row in cur.fetchall()]
+    # Maintained by the write paths, so this never scans the event tables
+    return jsonify(dashboard.summary())
 
-    # Top Genres (Simple count from movies watched)
-    cur = db.execute('''
-        SELECT m.genre, COUNT(*) as count 
-        FROM interactions i 
-        JOIN movies m ON i.movie_id = m.id 
-        WHERE i.interaction_type='watch' 
-        GROUP BY m.genre 
-        ORDER BY count DESC 
-        LIMIT 5
-    ''')
-    # Flatten genres if they are piped? For simplified View, just take raw group.
-    # To do it properly we'd split in python, but let's just return what we have.
-    top_genres = [dict(row) for row in cur.fetchall()]
 
+@app.route('/api/admin/metrics')
+def admin_metrics():
+    # Prometheus text format for scrapers; ?format=json for the dashboard
+    if request.args.get('format') == 'json':
+        return jsonify(metrics.registry.summary())
+    return Response(metrics.registry.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/admin/cache')
+def admin_cache_stats():
+    return jsonify(cache.stats())
+
+
+@app.route('/api/admin/db')
+def admin_db_stats():
+    return jsonify(connections.get_manager().stats())
+
+
+@app.route('/api/admin/ingest')
+def admin_ingest_stats():
+    if ingest_buffer is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(ingest_buffer.stats(), enabled=True))
+
+
+@app.route('/api/admin/refresh', methods=['POST'])
+def admin_refresh():
+    # Reload everything kept in memory after the database changed behind
+    # the app's back (bulk imports, backfills)
+    report = recommender.refresh_data()
+    with connections.write_locked() as conn:
+        trending_store.load(conn)
+        dashboard.load(conn)
+    for route in CACHE_CONFIG:
+        cache.invalidate(route)
+    return jsonify(report)
+
+
+@app.route('/api/admin/model')
+def admin_model_stats():
+    model = recommender.model
+    rebuilder = recommender.rebuilder
     return jsonify({
-        'total_users': total_users,
-        'total_interactions': total_interactions,
-        'total_watch_time': total_watch_time,
-        'recent_searches': recent_searches,
-        'recent_interactions': recent_interactions,
-        'top_genres': top_genres
+        'version': model.version,
+        'built_at': model.built_at,
+        'movies': len(model.movies),
+        'snapshot': model.snapshot_name,
+        'als': model.als_factors.meta if model.als_factors is not None else None,
+        'ann': {'lists': len(model.ann_index.lists), 'size': len(model.ann_index), 'added': model.ann_index.added,
+                'nprobe': model.ann_index.nprobe} if model.ann_index is not None else None,
+        'interaction_watermark': model.interaction_watermark,
+        'search_watermark': model.search_watermark,
+        'last_refresh': recommender.last_refresh,
+        'background_rebuild': rebuilder is not None,
+        'rebuilds': rebuilder.rebuilds if rebuilder else 0,
+        'last_error': rebuilder.last_error if rebuilder else None,
     })
 
 
+# Columns list endpoints may project with ?fields= (user password hashes are never listed)
+USER_FIELDS = {name: name for name in ('id', 'username', 'email')}
+MOVIE_FIELDS = {name: f'm.{name}' for name in ('id', 'title', 'genre', 'description', 'rating', 'year', 'image_url')}
+HISTORY_FIELDS = dict(MOVIE_FIELDS, interaction_type='i.interaction_type', timestamp='i.timestamp',
+                      watch_time='i.watch_time')
+
+def page_args(fields, cursor_length):
+    """(limit, cursor, SELECT list) from ?limit=, ?cursor= and ?fields=; raises PageError."""
+    return (pagination.page_size(request.args.get('limit')),
+            pagination.decode_cursor(request.args.get('cursor'), cursor_length),
+            pagination.parse_fields(request.args.get('fields'), fields))
+
+def page_response(rows, next_cursor):
+    # Bodies stay plain lists; the token for the next page (empty on the
+    # last one) goes in a header
+    resp = jsonify(rows)
+    resp.headers['X-Next-Cursor'] = next_cursor
+    return resp
+
+@app.errorhandler(pagination.PageError)
+def bad_page_request(e):
+    return jsonify({'error': str(e)}), 400
+
 @app.route('/api/users')
+@cache.cached('users')
 def get_users():
-    cur = get_db().execute('SELECT * FROM users')
-    users = [dict(row) for row in cur.fetchall()]
-    return jsonify(users)
+    # Keyset pagination on id: ?limit=&cursor=&fields=
+    limit, cursor, columns = page_args(USER_FIELDS, 1)
+    where, params = '', []
+    if cursor:
+        where, params = 'WHERE id > ?', cursor
+    cur = get_read_db().execute(f'SELECT {columns}, id AS _cursor_id FROM users {where} ORDER BY id LIMIT ?',
+                                params + [limit + 1])
+    return page_response(*pagination.page(cur.fetchall(), limit, ('_cursor_id',)))
 
 @app.route('/api/movies')
+@cache.cached('movies')
 def get_movies():
+    # Best rated first, keyset pagination on (rating, id): ?genre=&limit=&cursor=&fields=
+    # Unrated movies sort last as rating -1, matching the idx_movies_rating_key index
     genre = request.args.get('genre')
-    db = get_db()
-    
+    limit, cursor, columns = page_args(MOVIE_FIELDS, 2)
+    where, params = [], []
     if genre:
-        # Simple LIKE query for genre filtering
-        cur = db.execute('SELECT * FROM movies WHERE genre LIKE ? ORDER BY rating DESC', (f'%{genre}%',))
-    else:
-        # Return all movies
-        cur = db.execute('SELECT * FROM movies ORDER BY rating DESC')
-        
-    movies = [dict(row) for row in cur.fetchall()]
-    return jsonify(movies)
+        # Exact genre match through the indexed movie_genres table
+        where.append(catalog.GENRE_FILTER)
+        params.append(genre)
+    if cursor:
+        where.append('(COALESCE(m.rating, -1) < ? OR (COALESCE(m.rating, -1) = ? AND m.id > ?))')
+        params += [cursor[0], cursor[0], cursor[1]]
+    cur = get_read_db().execute(f'''
+        SELECT {columns}, COALESCE(m.rating, -1) AS _cursor_rating, m.id AS _cursor_id
+        FROM movies m
+        {'WHERE ' + ' AND '.join(where) if where else ''}
+        ORDER BY COALESCE(m.rating, -1) DESC, m.id
+        LIMIT ?
+    ''', params + [limit + 1])
+    return page_response(*pagination.page(cur.fetchall(), limit, ('_cursor_rating', '_cursor_id')))
+
+@app.route('/api/search')
+def search_movies():
+    # Full-text catalog search: ?q=...&genre=...&page=1&per_page=20
+    query = request.args.get('q', '')
+    genre = request.args.get('genre')
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+        per_page = min(max(int(request.args.get('per_page', 20)), 1), catalog.MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'page and per_page must be integers'}), 400
+
+    # Fetch one extra row to know whether another page follows
+    movies = catalog.search(get_read_db(), query, genre, limit=per_page + 1, offset=(page - 1) * per_page)
+    resp = jsonify(movies[:per_page])
+    if len(movies) > per_page:
+        resp.headers['X-Next-Page'] = str(page + 1)
+    return resp
 
 @app.route('/api/movies/<int:movie_id>')
+@cache.cached('movie')
 def get_movie_details(movie_id):
-    db = get_db()
+    db = get_read_db()
     cur = db.execute('SELECT * FROM movies WHERE id = ?', (movie_id,))
     movie = cur.fetchone()
     if movie:
@@ -125,9 +430,45 @@ def get_recommendations(user_id):
     # Get hybrid recommendations
     if not user_id:
         return jsonify([])
-    recs = recommender.get_hybrid_recommendations(user_id)
+    if not MATERIALIZE_RECOMMENDATIONS:
+        return jsonify(recommender.get_hybrid_recommendations(user_id))
+
+    version = materialized.model_version(recommender)
+    recs = materialized.get_fresh(get_read_db(), user_id, version, MATERIALIZED_MAX_AGE)
+    if recs is None:
+        # Miss: compute now and store so the next read is a single lookup
+        started = time.time()
+        watermarks = materialized.model_watermarks(recommender)
+        recs = recommender.get_hybrid_recommendations(user_id)
+        db = get_db()
+        materialized.store(db, user_id, recs, version, started, watermarks)
+        db.commit()
     return jsonify(recs)
 
+@app.route('/api/recommendations/batch', methods=['POST'])
+def get_recommendations_batch():
+    """Recommendations for many users, streamed back as one JSON object per line."""
+    data = event_data()
+    user_ids = data.get('user_ids')
+    top_n = data.get('top_n', 10)
+    if not isinstance(user_ids, list) or not user_ids:
+        return jsonify({'error': 'Missing user_ids list'}), 400
+    if len(user_ids) > MAX_BATCH_USERS:
+        return jsonify({'error': f'At most {MAX_BATCH_USERS} user_ids per batch'}), 400
+    try:
+        user_ids = [int(u) for u in user_ids]
+        top_n = int(top_n)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'user_ids and top_n must be integers'}), 400
+    if not 1 <= top_n <= MAX_TOP_N:
+        return jsonify({'error': f'top_n must be between 1 and {MAX_TOP_N}'}), 400
+
+    def generate():
+        for user_id, recs in recommender.recommend_many(user_ids, top_n=top_n):
+            yield json.dumps({'user_id': user_id, 'recommendations': recs}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 # Support for /api/recommendations?user_id=1
 @app.route('/api/recommendations')
 def get_recommendations_query():
@@ -143,7 +484,7 @@ def get_user_interests_query():
     if not user_id:
         return jsonify({'error': 'Missing user_id param'}), 400
     # Process interests for this user
-    return get_user_interests(int(user_id))
+    return get_user_interests(user_id=int(user_id))
 
 @app.route('/api/user/profile')
 def get_user_profile():
@@ -151,7 +492,7 @@ def get_user_profile():
     if not user_id:
         return jsonify({'error': 'Missing user_id param'}), 400
     
-    db = get_db()
+    db = get_read_db()
     cur = db.execute('SELECT id, username, email FROM users WHERE id = ?', (user_id,))
     user = cur.fetchone()
     if not user:
@@ -171,16 +512,24 @@ def register():
     if not all([username, email, password]):
         return jsonify({'error': 'Missing fields'}), 400
         
-    db = get_db()
+    db = get_read_db()
     # Check exists
     cur = db.execute('SELECT id FROM users WHERE email = ?', (email,))
     if cur.fetchone():
         return jsonify({'error': 'Email already registered'}), 400
         
     pwd_hash = generate_password_hash(password)
-    db.execute('INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)',
-               (username, email, pwd_hash))
+    db = get_db()
+    try:
+        db.execute('INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)',
+                   (username, email, pwd_hash))
+    except sqlite3.IntegrityError:
+        # Lost a race with a concurrent registration of the same email
+        return jsonify({'error': 'Email already registered'}), 400
+    count_user = dashboard.record_user(db)
     db.commit()
+    count_user()
+    cache.invalidate('users')
     
     return jsonify({'status': 'success'})
 
@@ -193,7 +542,7 @@ def login():
     if not all([email, password]):
         return jsonify({'error': 'Missing fields'}), 400
         
-    db = get_db()
+    db = get_read_db()
     cur = db.execute('SELECT * FROM users WHERE email = ?', (email,))
     user = cur.fetchone()
     
@@ -210,57 +559,142 @@ def login():
     return jsonify({'error': 'Invalid credentials'}), 401
 
 
+class EventError(ValueError):
+    """A tracking event with missing or malformed fields (answered with 400)."""
+
+@app.errorhandler(EventError)
+def bad_event(e):
+    return jsonify({'error': str(e)}), 400
+
+def event_data():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise EventError('Expected a JSON object')
+    return data
+
+def event_int(data, name, minimum=1, default=None):
+    """data[name] as an int >= minimum; numeric strings are accepted, bools are not."""
+    value = data.get(name)
+    if value is None:
+        if default is not None:
+            return default
+        raise EventError(f'Missing {name}')
+    try:
+        if isinstance(value, bool):
+            raise TypeError
+        value = int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise EventError(f'{name} must be an integer') from None
+    if value < minimum:
+        raise EventError(f'{name} must be at least {minimum}')
+    return value
+
+def event_text(data, name):
+    value = data.get(name)
+    if value is None or value == '':
+        raise EventError(f'Missing {name}')
+    if not isinstance(value, str) or not value.strip():
+        raise EventError(f'{name} must be a non-empty string')
+    return value
+
 @app.route('/api/interact', methods=['POST'])
 def interact():
-    data = request.json
-    user_id = data.get('user_id')
-    movie_id = data.get('movie_id')
-    interaction_type = data.get('type') # 'watch', 'like'
-    watch_time = data.get('watch_time', 0)
-
-    if not all([user_id, movie_id, interaction_type]):
-        return jsonify({'error': 'Missing data'}), 400
-
-    db = get_db()
-    # If it's a 'watch' interaction, we might want to update an existing record logic or just insert new. 
-    # For simplicity, we just insert.
-    db.execute('INSERT INTO interactions (user_id, movie_id, interaction_type, watch_time) VALUES (?, ?, ?, ?)',
-               (user_id, movie_id, interaction_type, watch_time))
-    db.commit()
+    # Validated and coerced here, before anything is written or queued
+    data = event_data()
+    user_id = event_int(data, 'user_id')
+    movie_id = event_int(data, 'movie_id')
+    interaction_type = event_text(data, 'type') # 'watch', 'like'
+    watch_time = event_int(data, 'watch_time', minimum=0, default=0)
+
+    event = (user_id, movie_id, interaction_type, watch_time)
+    if ingest_buffer is not None:
+        try:
+            ingest_buffer.submit_interaction(*event)
+        except (queue.Full, TimeoutError, IngestUnavailable):
+            return jsonify({'error': 'Tracking is overloaded, retry later'}), 503
+    else:
+        db = get_db()
+        updates = write_events(db, [event], [])
+        db.commit()
+        after_events([event], [], updates)
     
     return jsonify({'status': 'success'})
 
 @app.route('/api/track/search', methods=['POST'])
 def track_search():
-    data = request.json
-    user_id = data.get('user_id')
-    query = data.get('query')
-
-    if not all([user_id, query]):
-         return jsonify({'error': 'Missing data'}), 400
+    data = event_data()
+    user_id = event_int(data, 'user_id')
+    query = event_text(data, 'query')
     
-    db = get_db()
-    db.execute('INSERT INTO search_history (user_id, query) VALUES (?, ?)', (user_id, query))
-    db.commit()
+    if ingest_buffer is not None:
+        try:
+            ingest_buffer.submit_search(user_id, query)
+        except (queue.Full, TimeoutError, IngestUnavailable):
+            return jsonify({'error': 'Tracking is overloaded, retry later'}), 503
+    else:
+        db = get_db()
+        updates = write_events(db, [], [(user_id, query)])
+        db.commit()
+        after_events([], [(user_id, query)], updates)
 
     return jsonify({'status': 'success'})
 
+def write_events(conn, interactions, searches):
+    """Insert tracking events and apply their write-time side effects in the caller's transaction.
+
+    Returns the in-memory store updates to hand to after_events once the transaction commits.
+    """
+    # If it's a 'watch' interaction, we might want to update an existing record logic or just insert new. 
+    # For simplicity, we just insert.
+    conn.executemany('INSERT INTO interactions (user_id, movie_id, interaction_type, watch_time) VALUES (?, ?, ?, ?)',
+                     interactions)
+    conn.executemany('INSERT INTO search_history (user_id, query) VALUES (?, ?)', searches)
+    updates = []
+    for user_id, movie_id, interaction_type, watch_time in interactions:
+        updates.append(recommender.record_interaction(conn, user_id, movie_id, interaction_type, watch_time))
+        updates.append(trending_store.record_interaction(conn, movie_id))
+        updates.append(dashboard.record_interaction(conn, user_id, movie_id, interaction_type, watch_time))
+    for user_id, query in searches:
+        updates.append(recommender.record_search(conn, user_id, query))
+        updates.append(dashboard.record_search(conn, user_id, query))
+    for user_id in {row[0] for row in interactions} | {row[0] for row in searches}:
+        materialized.mark_stale(conn, user_id)
+    return updates
+
+def after_events(interactions, searches, updates=()):
+    """Side effects that must wait until tracking events have committed."""
+    for update in updates:
+        update()
+    for user_id in {row[0] for row in interactions}:
+        cache.invalidate('history', user_id)
+        cache.invalidate('interests', user_id)
+    if interactions:
+        cache.invalidate('trending')
+    # No cached read endpoint depends on search history, so searches invalidate nothing
+
 @app.route('/api/history/<int:user_id>')
+@cache.cached('history', user_arg='user_id')
 def get_history(user_id):
-    db = get_db()
-    cur = db.execute('''
-        SELECT m.*, i.interaction_type, i.timestamp, i.watch_time
+    # Newest first, keyset pagination on (timestamp, id): ?limit=&cursor=&fields=
+    limit, cursor, columns = page_args(HISTORY_FIELDS, 2)
+    where, params = '', [user_id]
+    if cursor:
+        where = 'AND (i.timestamp, i.id) < (?, ?)'
+        params += cursor
+    cur = get_read_db().execute(f'''
+        SELECT {columns}, i.timestamp AS _cursor_timestamp, i.id AS _cursor_id
         FROM interactions i 
         JOIN movies m ON i.movie_id = m.id 
-        WHERE i.user_id = ? 
-        ORDER BY i.timestamp DESC
-    ''', (user_id,))
-    history = [dict(row) for row in cur.fetchall()]
-    return jsonify(history)
+        WHERE i.user_id = ? {where}
+        ORDER BY i.timestamp DESC, i.id DESC
+        LIMIT ?
+    ''', params + [limit + 1])
+    return page_response(*pagination.page(cur.fetchall(), limit, ('_cursor_timestamp', '_cursor_id')))
 
 @app.route('/api/user/interests/<int:user_id>')
+@cache.cached('interests', user_arg='user_id')
 def get_user_interests(user_id):
-    db = get_db()
+    db = get_read_db()
     # Simple logic: derived from genres of movies watched or liked
     cur = db.execute('''
         SELECT m.genre
@@ -284,19 +718,45 @@ def get_user_interests(user_id):
     return jsonify(top_interests)
 
 @app.route('/api/trending')
+@cache.cached('trending')
 def get_trending():
-    db = get_db()
-    # Trending: movies with most interactions in the last X period (or just most interactions total for simplicity)
-    cur = db.execute('''
-        SELECT m.*, COUNT(i.id) as interaction_count
-        FROM movies m
-        JOIN interactions i ON m.id = i.movie_id
-        GROUP BY m.id
-        ORDER BY interaction_count DESC
-        LIMIT 10
-    ''')
-    trending = [dict(row) for row in cur.fetchall()]
-    return jsonify(trending)
+    # ?window=1h|24h|7d|all (default 7d) and optional ?genre=; a window with
+    # no activity falls back to all-time so the row is never empty
+    window = request.args.get('window', trending.DEFAULT_WINDOW)
+    genre = request.args.get('genre')
+    if window not in trending.WINDOWS:
+        return jsonify({'error': f"window must be one of {', '.join(trending.WINDOWS)}"}), 400
+    top = trending_store.top(window, k=10, genre=genre)
+    if not top and window != 'all':
+        top = trending_store.top('all', k=10, genre=genre)
+
+    db = get_read_db()
+    ids = [movie_id for movie_id, _ in top]
+    rows = {row['id']: dict(row) for row in
+            db.execute(f"SELECT * FROM movies WHERE id IN ({','.join('?' * len(ids))})", ids)}
+    trending_movies = [dict(rows[movie_id], interaction_count=count) for movie_id, count in top if movie_id in rows]
+    return jsonify(trending_movies)
+
+def start_ingest_buffer():
+    global ingest_buffer
+    if ingest_buffer is None:
+        ingest_buffer = IngestBuffer(connections.connect, write_events, after_events, **INGEST_CONFIG)
+        # Flush whatever is still queued on a clean shutdown
+        atexit.register(ingest_buffer.close)
+    return ingest_buffer
+
+if INGEST_BUFFER:
+    start_ingest_buffer()
+
+# Record API traffic for `python loadtest.py replay` when NETFLIX_REC_TRACE names a file
+TRACE_FILE = os.environ.get('NETFLIX_REC_TRACE')
+if TRACE_FILE:
+    from loadtest import TraceRecorder
+    TraceRecorder(TRACE_FILE).init_app(app)
 
 if __name__ == '__main__':
+    if MATERIALIZE_RECOMMENDATIONS:
+        materialized.RecomputeWorker(recommender, interval=RECOMPUTE_INTERVAL).start()
+    if BACKGROUND_REBUILD:
+        recommender.start_background_rebuild(interval=REBUILD_INTERVAL, min_events=REBUILD_MIN_EVENTS)
     app.run(debug=True, port=5000)
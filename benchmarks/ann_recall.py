@@ -0,0 +1,135 @@
+"""Recall@K and latency of the IVF index (ann.py) against exact search.
+
+Usage: python -m benchmarks.ann_recall [--sizes 10000 100000] [--source tfidf|als] [--k 10]
+                                       [--nprobe 1 4 8 16 32] [--queries 200] [--added 0.1] [--output PATH]
+
+Item vectors are SVD-reduced TF-IDF rows of a synthetic catalog, or ALS
+item factors trained on Zipf-distributed synthetic interactions. The index
+is built on all but the last --added share of items and the rest go in
+through incremental add(), as new movies would. Every query is an item's
+own vector (the item itself excluded), like a one-seed content query.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+import als
+import ann
+from benchmarks.content_scoring import synthetic_catalog
+from benchmarks.synthetic import zipf_choice
+
+# Interactions per item when training ALS factors
+ALS_EVENTS_PER_ITEM = 10
+ALS_ITERATIONS = 5
+
+
+def tfidf_vectors(n, seed=7):
+    movies = synthetic_catalog(n, seed=seed)
+    content = movies['genre'].str.replace('|', ' ') + ' ' + movies['description']
+    vectors, _ = ann.reduce(TfidfVectorizer(stop_words='english').fit_transform(content), seed=seed)
+    return vectors
+
+
+def als_vectors(n, seed=7):
+    rng = np.random.default_rng(seed)
+    events = n * ALS_EVENTS_PER_ITEM
+    users = zipf_choice(rng, n, events, 0.9)
+    items = zipf_choice(rng, n, events, 1.1)
+    confidence = sparse.csr_matrix((np.full(events, als.ALPHA), (users, items)), shape=(n, n))
+    confidence.sum_duplicates()
+    _, item_factors = als.train(confidence, iterations=ALS_ITERATIONS, seed=seed)
+    return ann.normalize(item_factors)
+
+
+SOURCES = {'tfidf': tfidf_vectors, 'als': als_vectors}
+
+
+def percentile_ms(timings, q):
+    return round(float(np.percentile(timings, q)) * 1000, 3)
+
+
+def run_size(n, source, k, nprobes, queries, added, seed=7):
+    vectors = SOURCES[source](n, seed)
+    n_built = n - int(n * added)
+
+    start = time.perf_counter()
+    index = ann.IVFIndex.build(vectors[:n_built], seed=seed)
+    build_s = time.perf_counter() - start
+    start = time.perf_counter()
+    index.add(vectors[n_built:])
+    add_s = time.perf_counter() - start
+
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(n, size=min(queries, n), replace=False)
+    exact, exact_timings = [], []
+    for row in rows:
+        start = time.perf_counter()
+        found, _ = ann.exact_search(vectors, vectors[row], k, exclude=[row])
+        exact_timings.append(time.perf_counter() - start)
+        exact.append(set(found.tolist()))
+
+    results = []
+    for nprobe in nprobes:
+        recalls, timings = [], []
+        for row, truth in zip(rows, exact):
+            start = time.perf_counter()
+            found, _ = index.search(vectors[row], k, nprobe=nprobe, exclude=[row])
+            timings.append(time.perf_counter() - start)
+            recalls.append(len(truth.intersection(found.tolist())) / max(len(truth), 1))
+        results.append({
+            'nprobe': nprobe,
+            f'recall@{k}': round(float(np.mean(recalls)), 4),
+            'p50_ms': percentile_ms(timings, 50),
+            'p95_ms': percentile_ms(timings, 95),
+            'speedup': round(float(np.median(exact_timings) / np.median(timings)), 2),
+        })
+    return {
+        'items': n,
+        'added_incrementally': n - n_built,
+        'lists': len(index.lists),
+        'dims': int(vectors.shape[1]),
+        'build_s': round(build_s, 3),
+        'add_s': round(add_s, 3),
+        'exact_p50_ms': percentile_ms(exact_timings, 50),
+        'nprobe': results,
+    }
+
+
+def print_table(results, k):
+    print(f"{'items':>8} {'lists':>6} {'nprobe':>7} {f'recall@{k}':>10} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'exact ms':>9} {'speedup':>8}")
+    for result in results['sizes']:
+        for row in result['nprobe']:
+            print(f"{result['items']:>8} {result['lists']:>6} {row['nprobe']:>7} {row[f'recall@{k}']:>10.3f} "
+                  f"{row['p50_ms']:>8.3f} {row['p95_ms']:>8.3f} {result['exact_p50_ms']:>9.3f} "
+                  f"{row['speedup']:>7.1f}x")
+        print(f"{result['items']:>8} build {result['build_s']:.2f}s, "
+              f"{result['added_incrementally']} added in {result['add_s']:.3f}s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 100000])
+    parser.add_argument('--source', choices=list(SOURCES), default='tfidf')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--nprobe', nargs='+', type=int, default=[1, 4, 8, 16, 32])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--added', type=float, default=0.1, help='share of items inserted after the build')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', help='also write the results as JSON')
+    args = parser.parse_args()
+
+    results = {
+        'source': args.source,
+        'k': args.k,
+        'sizes': [run_size(n, args.source, args.k, args.nprobe, args.queries, args.added, args.seed)
+                  for n in args.sizes],
+    }
+    print_table(results, args.k)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
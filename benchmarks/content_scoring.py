@@ -0,0 +1,84 @@
+"""Benchmark the content scoring engine against the previous list-based implementation.
+
+Usage: python -m benchmarks.content_scoring [--sizes 10000 100000] [--repeat 5]
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from recommender import Recommender
+
+GENRES = ['Action', 'Adventure', 'Animation', 'Biography', 'Crime', 'Drama', 'Fantasy',
+          'History', 'Horror', 'Romance', 'Sci-Fi', 'Thriller']
+
+
+def synthetic_catalog(n, seed=7, vocab_size=3000, words_per_title=12):
+    rng = np.random.default_rng(seed)
+    vocab = np.array([f'word{i}' for i in range(vocab_size)])
+    genres = [
+        '|'.join(rng.choice(GENRES, size=rng.integers(1, 3), replace=False))
+        for _ in range(n)
+    ]
+    descriptions = [' '.join(rng.choice(vocab, size=words_per_title)) for _ in range(n)]
+    return pd.DataFrame({
+        'id': np.arange(1, n + 1),
+        'title': [f'Title {i}' for i in range(1, n + 1)],
+        'genre': genres,
+        'description': descriptions,
+        'rating': np.round(rng.uniform(5, 9.5, size=n), 1),
+        'year': rng.integers(1950, 2024, size=n),
+        'image_url': '',
+    })
+
+
+def legacy_content_recommendations(rec, movie_ids, top_n=5):
+    """The pre-vectorization engine: per-seed tuple lists, full sort, per-row iloc exclusion."""
+    sim_scores = None
+    for movie_id in movie_ids:
+        if movie_id not in rec.indices:
+            continue
+        idx = rec.indices[movie_id]
+        scores = list(enumerate(rec.neighbors[idx].toarray().ravel()))
+        if sim_scores is None:
+            sim_scores = scores
+        else:
+            sim_scores = [(i, sim_scores[i][1] + scores[i][1]) for i in range(len(scores))]
+    sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
+    sim_scores = [x for x in sim_scores if rec.movies.iloc[x[0]]['id'] not in movie_ids]
+    movie_indices = [i[0] for i in sim_scores[:top_n]]
+    return rec.movies.iloc[movie_indices].to_dict('records')
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def run(sizes, repeat, seeds_per_query=3, top_n=15):
+    rng = np.random.default_rng(11)
+    print(f"{'titles':>8} {'build s':>8} {'legacy ms':>10} {'numpy ms':>9} {'speedup':>8} {'same':>5}")
+    for n in sizes:
+        start = time.perf_counter()
+        rec = Recommender.from_frames(synthetic_catalog(n))
+        build = time.perf_counter() - start
+
+        seeds = [int(x) for x in rng.choice(rec.movie_ids, size=seeds_per_query, replace=False)]
+        legacy_t, legacy = best_of(lambda: legacy_content_recommendations(rec, seeds, top_n), repeat)
+        fast_t, fast = best_of(lambda: rec.get_content_recommendations(seeds, top_n), repeat)
+        same = [m['id'] for m in legacy] == [m['id'] for m in fast]
+        print(f'{n:>8} {build:>8.1f} {legacy_t * 1000:>10.1f} {fast_t * 1000:>9.2f} '
+              f'{legacy_t / fast_t:>7.0f}x {str(same):>5}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    run(args.sizes, args.repeat)
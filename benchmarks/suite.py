@@ -0,0 +1,230 @@
+"""Scaling benchmarks for the Recommender pipeline on synthetic data.
+
+Usage: python -m benchmarks.suite [--scales 1k 10k 100k] [--queries 50] [--output PATH]
+                                  [--baseline PATH] [--tolerance 0.25] [--save-baseline PATH]
+
+For every scale a fresh SQLite database is generated and bulk imported,
+then each stage is timed (per-call stages report median and p95 over
+--queries calls) with its peak traced memory. Results are written as
+JSON; with --baseline, any stage slower than the baseline by more than
+--tolerance is reported and the exit status is 1.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import scipy
+import sklearn
+
+import als
+import connections
+import importer
+from benchmarks import synthetic
+from recommender import Recommender
+
+DEFAULT_OUTPUT = os.path.join('benchmarks', 'results', 'latest.json')
+# New events appended before timing an incremental refresh
+INCREMENTAL_EVENTS = 100
+BATCH_USERS = 1000
+
+
+def measure(fn, track_memory):
+    """(result, seconds, peak MB) for one call; peak is None without memory tracking."""
+    if track_memory:
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    peak = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1) if track_memory else None
+    return result, elapsed, peak
+
+
+def measure_calls(fn, args, track_memory):
+    """Stats for fn(arg) over every arg: median / p95 milliseconds and the peak memory of the whole run."""
+    if track_memory:
+        tracemalloc.reset_peak()
+    timings = []
+    for arg in args:
+        start = time.perf_counter()
+        fn(arg)
+        timings.append(time.perf_counter() - start)
+    timings = np.array(timings) * 1000
+    return {
+        'calls': len(timings),
+        'median_ms': round(float(np.median(timings)), 3),
+        'p95_ms': round(float(np.percentile(timings, 95)), 3),
+        'total_s': round(float(timings.sum()) / 1000, 3),
+        'peak_mb': round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1) if track_memory else None,
+    }
+
+
+def single(seconds, peak):
+    return {'seconds': round(seconds, 4), 'peak_mb': peak}
+
+
+def run_scale(scale, workdir, queries, seed=7, track_memory=True):
+    """Stage results for one synthetic scale, using a database under workdir."""
+    stages = {}
+    frames, seconds, peak = measure(lambda: synthetic.generate(scale, seed), track_memory)
+    stages['generate'] = single(seconds, peak)
+
+    data_dir = os.path.join(workdir, scale)
+    paths = synthetic.write(frames, data_dir)
+    connections.configure(os.path.join(data_dir, 'bench.db'))
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, seconds, peak = measure(lambda: importer.run(paths, resume=False, log=lambda *_: None), track_memory)
+    stages['import'] = single(seconds, peak)
+
+    rec, seconds, peak = measure(lambda: Recommender(incremental=True), track_memory)
+    stages['refresh_full'] = single(seconds, peak)
+
+    rng = np.random.default_rng(seed)
+    movie_ids = frames['movies']['id'].to_numpy()
+    active_users = frames['interactions']['user_id'].unique()
+    new_events = [(int(u), int(m), 'watch', 600) for u, m in zip(rng.choice(active_users, INCREMENTAL_EVENTS),
+                                                                   rng.choice(movie_ids, INCREMENTAL_EVENTS))]
+    with connections.writer() as conn:
+        conn.executemany('INSERT INTO interactions (user_id, movie_id, interaction_type, watch_time) '
+                         'VALUES (?, ?, ?, ?)', new_events)
+        conn.commit()
+    _, seconds, peak = measure(lambda: rec.refresh_data(incremental=True), track_memory)
+    stages['refresh_incremental'] = single(seconds, peak)
+
+    users = [int(u) for u in rng.choice(active_users, size=queries)]
+    seeds = [[int(m) for m in rng.choice(movie_ids, size=3, replace=False)] for _ in range(queries)]
+    stages['content'] = measure_calls(lambda s: rec.get_content_recommendations(s, top_n=15), seeds, track_memory)
+    stages['collaborative'] = measure_calls(lambda u: rec.get_collaborative_recommendations(u, top_n=15), users,
+                                            track_memory)
+    stages['genre_profile'] = measure_calls(rec.calculate_genre_profile, users, track_memory)
+    stages['hybrid'] = measure_calls(rec.get_hybrid_recommendations, users, track_memory)
+
+    batch = [int(u) for u in rng.choice(active_users, size=min(BATCH_USERS, len(active_users)), replace=False)]
+    _, seconds, peak = measure(lambda: list(rec.recommend_many(batch)), track_memory)
+    stages['batch'] = dict(single(seconds, peak), users=len(batch))
+
+    factors, seconds, peak = measure(lambda: als.fit(rec.model), track_memory)
+    stages['als_train'] = single(seconds, peak)
+    rec.als_path = os.path.join(data_dir, als.FACTORS_FILE)
+    als.save(factors, rec.als_path)
+    rec.refresh_data()
+    stages['als'] = measure_calls(lambda u: rec.get_als_recommendations(u, top_n=15), users, track_memory)
+
+    connections.get_manager().close()
+    return {
+        'rows': {kind: len(frame) for kind, frame in frames.items()},
+        'stages': stages,
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'scipy': scipy.__version__,
+        'sklearn': sklearn.__version__,
+    }
+
+
+def headline(stage):
+    """The number compared against the baseline for a stage."""
+    return stage['median_ms'] / 1000 if 'median_ms' in stage else stage['seconds']
+
+
+def compare(results, baseline, tolerance):
+    """Lines describing every stage slower than baseline by more than tolerance (a fraction)."""
+    regressions = []
+    for scale, current in results['scales'].items():
+        previous = baseline.get('scales', {}).get(scale)
+        if previous is None:
+            continue
+        for name, stage in current['stages'].items():
+            if name not in previous['stages']:
+                continue
+            old, new = headline(previous['stages'][name]), headline(stage)
+            if old > 0 and new > old * (1 + tolerance):
+                regressions.append(f'{scale} {name}: {old * 1000:.2f} ms -> {new * 1000:.2f} ms '
+                                   f'({new / old:.2f}x)')
+    return regressions
+
+
+def print_table(results):
+    print(f"{'scale':>6} {'stage':>20} {'time':>12} {'p95':>10} {'peak MB':>8}")
+    for scale, result in results['scales'].items():
+        for name, stage in result['stages'].items():
+            if 'median_ms' in stage:
+                time_col, p95 = f"{stage['median_ms']:.2f} ms", f"{stage['p95_ms']:.2f} ms"
+            else:
+                time_col, p95 = f"{stage['seconds']:.3f} s", ''
+            peak = '' if stage['peak_mb'] is None else f"{stage['peak_mb']:.1f}"
+            print(f'{scale:>6} {name:>20} {time_col:>12} {p95:>10} {peak:>8}')
+
+
+def run(scales, queries, seed=7, track_memory=True):
+    if track_memory:
+        tracemalloc.start()
+    try:
+        with tempfile.TemporaryDirectory(prefix='rec-bench-') as workdir:
+            return {
+                'environment': environment(),
+                'settings': {'queries': queries, 'seed': seed, 'track_memory': track_memory},
+                'scales': {scale: run_scale(scale, workdir, queries, seed, track_memory) for scale in scales},
+            }
+    finally:
+        if track_memory:
+            tracemalloc.stop()
+
+
+def write_json(data, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', nargs='+', choices=list(synthetic.SCALES), default=['1k', '10k', '100k'])
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--no-memory', action='store_true', help='skip tracemalloc (it slows Python-heavy stages)')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    parser.add_argument('--baseline', help='results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown vs baseline (0.25 = 25%%)')
+    parser.add_argument('--save-baseline', metavar='PATH', help='also store these results as a baseline')
+    args = parser.parse_args()
+
+    results = run(args.scales, args.queries, args.seed, not args.no_memory)
+    print_table(results)
+    write_json(results, args.output)
+    print(f"Results written to {args.output}")
+    if args.save_baseline:
+        write_json(results, args.save_baseline)
+        print(f"Baseline written to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for line in regressions:
+                print('  ' + line)
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
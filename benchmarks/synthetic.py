@@ -0,0 +1,96 @@
+"""Seeded synthetic catalogs, users and Zipf-distributed interaction histories.
+
+Usage: python -m benchmarks.synthetic --scale 100k --out data/ [--seed 7]
+
+Writes movies.jsonl, users.jsonl, interactions.jsonl and searches.jsonl in
+the format importer.py reads.
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.content_scoring import GENRES, synthetic_catalog
+
+# Named scales by number of interactions: (movies, users, interactions, searches)
+SCALES = {
+    '1k': (200, 100, 1000, 200),
+    '10k': (1000, 500, 10000, 2000),
+    '100k': (5000, 5000, 100000, 20000),
+    '1m': (20000, 50000, 1000000, 200000),
+}
+# Zipf exponents for movie popularity and user activity
+MOVIE_ZIPF = 1.1
+USER_ZIPF = 0.9
+# Share of watch / like / dislike events
+INTERACTION_MIX = {'watch': 0.7, 'like': 0.25, 'dislike': 0.05}
+HISTORY_DAYS = 30
+
+
+def zipf_choice(rng, n, size, exponent):
+    """`size` draws from 0..n-1 with P(rank k) proportional to 1 / (k + 1) ** exponent, ranks shuffled."""
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    ranks = rng.choice(n, size=size, p=weights / weights.sum())
+    return rng.permutation(n)[ranks]
+
+
+def _timestamps(rng, size, start):
+    offsets = np.sort(rng.uniform(0, HISTORY_DAYS * 86400, size=size))
+    return (start + pd.to_timedelta(offsets, unit='s')).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def generate(scale, seed=7):
+    """Frames {'movies', 'users', 'interactions', 'searches'} for a named scale (see SCALES)."""
+    n_movies, n_users, n_interactions, n_searches = SCALES[scale]
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp('2024-01-01')
+
+    movies = synthetic_catalog(n_movies, seed=seed)
+    users = pd.DataFrame({
+        'id': np.arange(1, n_users + 1),
+        'username': [f'user{i}' for i in range(1, n_users + 1)],
+        'email': [f'user{i}@example.com' for i in range(1, n_users + 1)],
+        # Not a usable hash: synthetic users never log in
+        'password_hash': 'synthetic',
+    })
+
+    kinds = rng.choice(list(INTERACTION_MIX), size=n_interactions, p=list(INTERACTION_MIX.values()))
+    watch_time = np.where(kinds == 'watch', rng.lognormal(7.5, 1.0, size=n_interactions).astype(np.int64), 0)
+    interactions = pd.DataFrame({
+        'id': np.arange(1, n_interactions + 1),
+        'user_id': zipf_choice(rng, n_users, n_interactions, USER_ZIPF) + 1,
+        'movie_id': zipf_choice(rng, n_movies, n_interactions, MOVIE_ZIPF) + 1,
+        'interaction_type': kinds,
+        'watch_time': watch_time,
+        'timestamp': _timestamps(rng, n_interactions, start),
+    })
+
+    words = np.array(GENRES + ['movies', 'best', 'new', 'classic', 'night', 'family'])
+    searches = pd.DataFrame({
+        'id': np.arange(1, n_searches + 1),
+        'user_id': zipf_choice(rng, n_users, n_searches, USER_ZIPF) + 1,
+        'query': [' '.join(rng.choice(words, size=rng.integers(1, 4))) for _ in range(n_searches)],
+        'timestamp': _timestamps(rng, n_searches, start),
+    })
+    return {'movies': movies, 'users': users, 'interactions': interactions, 'searches': searches}
+
+
+def write(frames, directory):
+    """Write frames as <kind>.jsonl files for importer.py; returns {kind: path}."""
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for kind, frame in frames.items():
+        paths[kind] = os.path.join(directory, f'{kind}.jsonl')
+        frame.to_json(paths[kind], orient='records', lines=True)
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=list(SCALES), default='10k')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--out', required=True)
+    args = parser.parse_args()
+    for path in write(generate(args.scale, args.seed), args.out).values():
+        print(f"Wrote {path}")
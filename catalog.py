@@ -0,0 +1,44 @@
+import re
+
+# bm25 column weights for (title, description, genre): a hit in the title
+# counts most, then genre, then the free-text description
+BM25_WEIGHTS = (10.0, 1.0, 5.0)
+MAX_PAGE_SIZE = 100
+
+# WHERE clause for an exact (case-insensitive) genre match on movies aliased m
+GENRE_FILTER = 'm.id IN (SELECT movie_id FROM movie_genres WHERE genre = ?)'
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+def fts_query(text):
+    """Turn free user input into an FTS5 MATCH expression, or None if it has no searchable words.
+
+    Every word must match (implicit AND) and the last one also matches as a
+    prefix, so results update sensibly while someone is still typing. Words
+    are quoted, so FTS5 operators in the input are searched as plain text.
+    """
+    words = _TOKEN.findall(text or '')
+    if not words:
+        return None
+    terms = ['"' + w.replace('"', '""') + '"' for w in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+def search(conn, text, genre=None, limit=20, offset=0):
+    """Movies matching text, best bm25 rank first, optionally limited to one exact genre."""
+    match = fts_query(text)
+    if match is None:
+        return []
+    where, params = '', [match]
+    if genre:
+        where = ' AND ' + GENRE_FILTER
+        params.append(genre)
+    cur = conn.execute(f'''
+        SELECT m.*
+        FROM movies_fts f
+        JOIN movies m ON m.id = f.rowid
+        WHERE movies_fts MATCH ?{where}
+        ORDER BY bm25(movies_fts, {', '.join(map(str, BM25_WEIGHTS))}), m.id
+        LIMIT ? OFFSET ?
+    ''', params + [limit, offset])
+    return [dict(row) for row in cur.fetchall()]
@@ -0,0 +1,183 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Absolute path of the SQLite database, overridable with NETFLIX_REC_DB
+DB_PATH = os.path.abspath(os.environ.get(
+    'NETFLIX_REC_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'netflix_rec.db')))
+
+# Applied once when a connection is opened. WAL itself is persistent and
+# is switched on by database.migrate().
+CONNECTION_PRAGMAS = [
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA busy_timeout = 5000',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -20000',
+    'PRAGMA mmap_size = 268435456',
+]
+READER_PRAGMAS = ['PRAGMA query_only = 1']
+
+READER_POOL_SIZE = 8
+WRITER_POOL_SIZE = 2
+POOL_TIMEOUT = 10.0
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def connect(path=None, readonly=False):
+    """Open a configured connection. Pooled handles come from reader()/writer();
+    long-lived background threads and scripts use this directly."""
+    path = path or DB_PATH
+    if readonly:
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS + (READER_PRAGMAS if readonly else []):
+        conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    """Thread-safe pool of at most `size` connections, opened lazily and reused."""
+
+    def __init__(self, factory, size, timeout=POOL_TIMEOUT):
+        self.factory = factory
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._stats = {'acquired': 0, 'waited': 0, 'timeouts': 0, 'wait_ms_total': 0.0, 'wait_ms_max': 0.0}
+
+    def acquire(self):
+        start = time.perf_counter()
+        waited = False
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._opened < self.size
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                try:
+                    conn = self.factory()
+                except Exception:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            else:
+                waited = True
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._stats['timeouts'] += 1
+                    raise PoolTimeout(f'No connection free after {self.timeout}s')
+
+        wait_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._stats['acquired'] += 1
+            self._stats['waited'] += waited
+            self._stats['wait_ms_total'] += wait_ms
+            self._stats['wait_ms_max'] = max(self._stats['wait_ms_max'], wait_ms)
+        return conn
+
+    def release(self, conn):
+        # Never hand out a connection with a half-finished transaction
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._opened -= 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['open'] = self._opened
+        stats['idle'] = self._idle.qsize()
+        stats['size'] = self.size
+        stats['wait_ms_avg'] = round(stats['wait_ms_total'] / stats['acquired'], 3) if stats['acquired'] else 0.0
+        stats['wait_ms_total'] = round(stats['wait_ms_total'], 3)
+        stats['wait_ms_max'] = round(stats['wait_ms_max'], 3)
+        return stats
+
+
+class ConnectionManager:
+    """Separate pools of read-only and writer connections to one database file."""
+
+    def __init__(self, path=None, readers=READER_POOL_SIZE, writers=WRITER_POOL_SIZE):
+        self.path = os.path.abspath(path or DB_PATH)
+        self.readers = ConnectionPool(lambda: connect(self.path, readonly=True), readers)
+        self.writers = ConnectionPool(lambda: connect(self.path), writers)
+
+    def close(self):
+        self.readers.close()
+        self.writers.close()
+
+    def stats(self):
+        return {'path': self.path, 'readers': self.readers.stats(), 'writers': self.writers.stats()}
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def configure(path=None, readers=READER_POOL_SIZE, writers=WRITER_POOL_SIZE):
+    """Point the shared manager at another database (closing the old pools)."""
+    global _manager, DB_PATH
+    with _manager_lock:
+        if _manager is not None:
+            _manager.close()
+        if path:
+            DB_PATH = os.path.abspath(path)
+        _manager = ConnectionManager(DB_PATH, readers, writers)
+        return _manager
+
+def get_manager():
+    if _manager is None:
+        configure()
+    return _manager
+
+def reader():
+    """Context manager yielding a pooled read-only connection."""
+    return get_manager().readers.connection()
+
+def writer():
+    """Context manager yielding a pooled writer connection (caller commits)."""
+    return get_manager().writers.connection()
+
+@contextmanager
+def write_locked():
+    """Pooled writer connection holding the database write lock for the whole block.
+
+    No write transaction can be open meanwhile, so in-memory stores can
+    reload from the tables without racing a commit whose post-commit
+    update has not run yet. Keep the block short: writers wait on it.
+    """
+    with writer() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        finally:
+            conn.rollback()
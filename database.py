@@ -1,23 +1,21 @@
-import sqlite3
 import os
+import sys
 
-DB_NAME = 'netflix_rec.db'
+import connections
 
 def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """A fresh, configured writer connection (scripts and background threads)."""
+    return connections.connect()
 
-def init_db():
-    if os.path.exists(DB_NAME):
-        os.remove(DB_NAME)
-    
-    conn = get_db_connection()
-    c = conn.cursor()
+# --- Schema migrations ---
+# Each migration runs once, in order, inside its own transaction, and bumps
+# PRAGMA user_version. They only ever add tables, columns and indexes (or
+# backfill derived data): never drop or rewrite user data. Append new
+# migrations to the end of the list; never edit one that has shipped.
 
-    # Create Tables
-    c.execute('''
-        CREATE TABLE users (
+def _create_base_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             username TEXT NOT NULL,
             email TEXT UNIQUE NOT NULL,
@@ -25,8 +23,8 @@ def init_db():
         )
     ''')
 
-    c.execute('''
-        CREATE TABLE movies (
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS movies (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             title TEXT NOT NULL,
             genre TEXT NOT NULL,
@@ -37,8 +35,8 @@ def init_db():
         )
     ''') 
 
-    c.execute('''
-        CREATE TABLE interactions (
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS interactions (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER,
             movie_id INTEGER,
@@ -50,8 +48,8 @@ def init_db():
         )
     ''')
 
-    c.execute('''
-        CREATE TABLE search_history (
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS search_history (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER,
             query TEXT NOT NULL,
@@ -60,6 +58,237 @@ def init_db():
         )
     ''')
 
+# Secondary indexes for the hot read paths (per-user history, joins on
+# movie_id, and the ORDER BY timestamp DESC feeds on the admin dashboard).
+HOT_PATH_INDEXES = {
+    'idx_interactions_user_time': 'interactions (user_id, timestamp)',
+    'idx_interactions_movie': 'interactions (movie_id)',
+    'idx_interactions_time': 'interactions (timestamp)',
+    'idx_search_history_user_time': 'search_history (user_id, timestamp)',
+    'idx_search_history_time': 'search_history (timestamp)',
+}
+
+def create_indexes(conn, indexes=HOT_PATH_INDEXES):
+    for name, target in indexes.items():
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {target}')
+
+def _create_hot_path_indexes(conn):
+    create_indexes(conn)
+
+def _create_user_genre_profile(conn):
+    existed = _table_exists(conn, 'user_genre_profile')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_genre_profile (
+            user_id INTEGER NOT NULL,
+            genre TEXT NOT NULL,
+            score INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, genre)
+        )
+    ''')
+    if not existed:
+        from profiles import backfill
+        backfill(conn)
+
+def _create_user_recommendations(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_recommendations (
+            user_id INTEGER PRIMARY KEY,
+            payload TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            computed_at REAL NOT NULL,
+            stale INTEGER NOT NULL DEFAULT 0,
+            stale_at REAL,
+            -- Model watermarks the list was computed with, and the newest
+            -- event ids when it was marked stale (see materialized.store)
+            interaction_watermark INTEGER,
+            search_watermark INTEGER,
+            stale_interaction INTEGER,
+            stale_search INTEGER
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_user_recommendations_stale '
+                 'ON user_recommendations (user_id) WHERE stale = 1')
+
+def _create_movie_trending_buckets(conn):
+    existed = _table_exists(conn, 'movie_trending_buckets')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS movie_trending_buckets (
+            movie_id INTEGER NOT NULL,
+            bucket INTEGER NOT NULL, -- hours since the epoch (UTC)
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (movie_id, bucket)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_movie_trending_buckets_bucket ON movie_trending_buckets (bucket)')
+    if not existed:
+        from trending import backfill
+        backfill(conn)
+
+def _create_dashboard_aggregates(conn):
+    existed = _table_exists(conn, 'dashboard_counters')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS dashboard_counters (
+            name TEXT PRIMARY KEY,
+            value NUMERIC NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS genre_watch_counts (
+            genre TEXT PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    if not existed:
+        from aggregates import backfill
+        backfill(conn)
+
+# movie_genres holds one row per '|'-separated genre of each movie, in
+# order, kept in sync by triggers (the genre string is split by turning it
+# into a JSON array for json_each, since triggers cannot use CTEs).
+_SPLIT_GENRES = '''
+    INSERT INTO movie_genres (movie_id, position, genre)
+    SELECT new.id, key, value
+    FROM json_each('[' || replace(json_quote(new.genre), '|', '","') || ']');
+'''
+
+def _create_catalog_search(conn):
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS movies_fts USING fts5(
+            title, description, genre,
+            content='movies', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS movie_genres (
+            movie_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            genre TEXT NOT NULL COLLATE NOCASE,
+            PRIMARY KEY (movie_id, position)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_movie_genres_genre ON movie_genres (genre, movie_id)')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS movies_ai AFTER INSERT ON movies BEGIN
+            INSERT INTO movies_fts (rowid, title, description, genre)
+            VALUES (new.id, new.title, new.description, new.genre);
+            {_SPLIT_GENRES}
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS movies_ad AFTER DELETE ON movies BEGIN
+            INSERT INTO movies_fts (movies_fts, rowid, title, description, genre)
+            VALUES ('delete', old.id, old.title, old.description, old.genre);
+            DELETE FROM movie_genres WHERE movie_id = old.id;
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS movies_au AFTER UPDATE ON movies BEGIN
+            INSERT INTO movies_fts (movies_fts, rowid, title, description, genre)
+            VALUES ('delete', old.id, old.title, old.description, old.genre);
+            INSERT INTO movies_fts (rowid, title, description, genre)
+            VALUES (new.id, new.title, new.description, new.genre);
+            DELETE FROM movie_genres WHERE movie_id = old.id;
+            {_SPLIT_GENRES}
+        END
+    ''')
+    # Index whatever the catalog already holds
+    conn.execute("INSERT INTO movies_fts (movies_fts) VALUES ('rebuild')")
+    conn.execute('DELETE FROM movie_genres')
+    conn.execute(_SPLIT_GENRES.replace('new.', 'movies.').replace(
+        'FROM json_each', 'FROM movies, json_each'))
+
+# Serve ORDER BY COALESCE(rating, -1) DESC, id for keyset-paginated /api/movies
+PAGINATION_INDEXES = {
+    'idx_movies_rating_key': 'movies (COALESCE(rating, -1) DESC, id)',
+}
+
+def _create_pagination_indexes(conn):
+    create_indexes(conn, PAGINATION_INDEXES)
+
+def _create_import_progress(conn):
+    # One row per imported file (see importer.py); rows_done commits with each chunk
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS import_progress (
+            source TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            rows_done INTEGER NOT NULL DEFAULT 0,
+            finished INTEGER NOT NULL DEFAULT 0,
+            size INTEGER,
+            mtime REAL,
+            updated_at REAL
+        )
+    ''')
+
+def _create_catalog_version(conn):
+    # Single-row counter bumped on every change to movies; the recommender
+    # compares it to decide whether the catalog must be re-read
+    conn.execute('CREATE TABLE IF NOT EXISTS catalog_version (version INTEGER NOT NULL)')
+    conn.execute('INSERT INTO catalog_version (version) SELECT 1 WHERE NOT EXISTS (SELECT 1 FROM catalog_version)')
+    for name, event in (('movies_version_ai', 'INSERT'), ('movies_version_au', 'UPDATE'),
+                        ('movies_version_ad', 'DELETE')):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON movies BEGIN
+                UPDATE catalog_version SET version = version + 1;
+            END
+        ''')
+
+MIGRATIONS = [
+    (1, 'base tables', _create_base_tables),
+    (2, 'hot path indexes', _create_hot_path_indexes),
+    (3, 'user genre profiles', _create_user_genre_profile),
+    (4, 'materialized recommendations', _create_user_recommendations),
+    (5, 'trending buckets', _create_movie_trending_buckets),
+    (6, 'dashboard aggregates', _create_dashboard_aggregates),
+    (7, 'catalog search', _create_catalog_search),
+    (8, 'pagination indexes', _create_pagination_indexes),
+    (9, 'import progress', _create_import_progress),
+    (10, 'catalog version', _create_catalog_version),
+]
+
+def _table_exists(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,)).fetchone() is not None
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(conn):
+    """Apply pending migrations and enable WAL; returns the list of versions applied."""
+    conn.execute('PRAGMA journal_mode = WAL')
+    applied = []
+    for version, name, apply in MIGRATIONS:
+        if version <= schema_version(conn):
+            continue
+        conn.execute('BEGIN')
+        try:
+            apply(conn)
+            conn.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"Applied migration {version}: {name}")
+        applied.append(version)
+    return applied
+
+def init_db(reset=False):
+    """Bring the database schema up to date and seed it if empty.
+
+    Existing data is kept; pass reset=True to delete the database file first.
+    """
+    if reset:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(connections.DB_PATH + suffix):
+                os.remove(connections.DB_PATH + suffix)
+    
+    conn = get_db_connection()
+    migrate(conn)
+    if conn.execute('SELECT COUNT(*) FROM movies').fetchone()[0]:
+        conn.close()
+        print("Database up to date.")
+        return
+
+    c = conn.cursor()
+
     # Seed Data
     # Password for all is 'password' -> pbkdf2:sha256:260000... (just using a placeholder or actually generating one in python would be better, but for init_db let's use a clear placeholder or just run a quick script)
     # Actually, let's just make the 'init_db' function cleaner or handle hashing in app. 
@@ -124,9 +353,18 @@ def init_db():
     ]
     c.executemany('INSERT INTO search_history (user_id, query) VALUES (?, ?)', searches)
 
+    # Precomputed genre profiles, trending counts and dashboard totals for the seeded history
+    from profiles import backfill
+    backfill(conn)
+    import aggregates
+    import trending
+    trending.backfill(conn)
+    aggregates.backfill(conn)
+
     conn.commit()
     conn.close()
     print("Database initialized.")
 
 if __name__ == '__main__':
-    init_db()
+    # python database.py [--reset]
+    init_db(reset='--reset' in sys.argv[1:])
@@ -0,0 +1,231 @@
+"""Bulk import of movies, users, interactions and searches from JSONL or CSV.
+
+    python importer.py --movies movies.jsonl --interactions events.csv [--notify http://localhost:5000]
+
+Files are streamed and inserted in chunked transactions. Every chunk
+commits together with its row in `import_progress`, so an interrupted run
+picks up after the last committed chunk when started again with the same
+arguments. Secondary indexes are dropped while loading and rebuilt at the
+end, followed by the derived tables and a single content model build.
+Dropping indexes slows every other reader down, so load while the server
+is idle and use --notify to have it pick up the result.
+"""
+import argparse
+import csv
+import json
+import os
+import time
+import urllib.request
+
+import aggregates
+import connections
+import profiles
+import snapshot
+import trending
+from database import HOT_PATH_INDEXES, PAGINATION_INDEXES, create_indexes, get_db_connection, migrate
+
+DEFAULT_CHUNK_SIZE = 5000
+# Seconds between rows/sec progress lines
+REPORT_INTERVAL = 2.0
+
+# Columns accepted per kind; the first ones are required. Missing optional
+# columns get the table default (timestamp: import time).
+KINDS = {
+    'movies': {
+        'table': 'movies',
+        'required': ('title', 'genre'),
+        'optional': ('id', 'description', 'rating', 'year', 'image_url'),
+    },
+    'users': {
+        'table': 'users',
+        'required': ('username', 'email', 'password_hash'),
+        'optional': ('id',),
+    },
+    'interactions': {
+        'table': 'interactions',
+        'required': ('user_id', 'movie_id', 'interaction_type'),
+        'optional': ('id', 'watch_time', 'timestamp'),
+    },
+    'searches': {
+        'table': 'search_history',
+        'required': ('user_id', 'query'),
+        'optional': ('id', 'timestamp'),
+    },
+}
+# Dependencies first: events reference users and movies
+ORDER = ('movies', 'users', 'interactions', 'searches')
+
+DEFERRED_INDEXES = dict(HOT_PATH_INDEXES, **PAGINATION_INDEXES)
+
+def read_records(path, fmt=None):
+    """Yield one dict per record of a .jsonl/.ndjson or .csv file without loading it whole."""
+    fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+    with open(path, newline='' if fmt == 'csv' else None, encoding='utf-8') as f:
+        if fmt == 'csv':
+            # Empty CSV cells mean "not given"
+            for row in csv.DictReader(f):
+                yield {k: v for k, v in row.items() if v != ''}
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def _insert_sql(kind, columns):
+    table = KINDS[kind]['table']
+    # Users are unique by email; re-importing one is skipped rather than failing the chunk
+    verb = 'INSERT OR IGNORE' if kind == 'users' else 'INSERT'
+    return f"{verb} INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+def _source_key(kind, path):
+    return f'{kind}:{os.path.abspath(path)}'
+
+def import_file(conn, kind, path, fmt=None, chunk_size=DEFAULT_CHUNK_SIZE, resume=True, log=print):
+    """Load one file in chunked transactions; returns the number of rows inserted by this run."""
+    spec = KINDS[kind]
+    source = _source_key(kind, path)
+    stat = os.stat(path)
+    row = conn.execute('SELECT rows_done, finished, size, mtime FROM import_progress WHERE source = ?',
+                       (source,)).fetchone()
+    skip = 0
+    if row is not None and resume:
+        if (row['size'], row['mtime']) != (stat.st_size, stat.st_mtime):
+            raise SystemExit(f"{path} changed since its last import; rerun with --restart to load it again")
+        if row['finished']:
+            log(f"{kind}: {path} already imported ({row['rows_done']} rows), skipping")
+            return 0
+        skip = row['rows_done']
+        log(f"{kind}: resuming {path} after {skip} rows")
+    conn.execute('''
+        INSERT INTO import_progress (source, kind, rows_done, finished, size, mtime, updated_at)
+        VALUES (?, ?, ?, 0, ?, ?, ?)
+        ON CONFLICT (source) DO UPDATE SET
+            rows_done = excluded.rows_done, finished = 0, size = excluded.size,
+            mtime = excluded.mtime, updated_at = excluded.updated_at
+    ''', (source, kind, skip, stat.st_size, stat.st_mtime, time.time()))
+    conn.commit()
+
+    # A chunk is a list of runs of consecutive records with the same column
+    # set (optional fields may be left out), each inserted with one
+    # executemany so rows keep their file order
+    allowed = spec['required'] + spec['optional']
+    done = skip
+    inserted = 0
+    chunk = []
+    pending = 0
+    start = last_report = time.perf_counter()
+
+    def flush():
+        nonlocal inserted, pending
+        for columns, values in chunk:
+            inserted += conn.executemany(_insert_sql(kind, columns), values).rowcount
+        conn.execute('UPDATE import_progress SET rows_done = ?, updated_at = ? WHERE source = ?',
+                     (done, time.time(), source))
+        conn.commit()
+        chunk.clear()
+        pending = 0
+
+    for n, record in enumerate(read_records(path, fmt)):
+        if n < skip:
+            continue
+        missing = [c for c in spec['required'] if record.get(c) in (None, '')]
+        if missing:
+            raise ValueError(f"{path}: record {n + 1} is missing {', '.join(missing)}")
+        columns = tuple(c for c in allowed if record.get(c) is not None)
+        if not chunk or chunk[-1][0] != columns:
+            chunk.append((columns, []))
+        chunk[-1][1].append(tuple(record[c] for c in columns))
+        done += 1
+        pending += 1
+        if pending >= chunk_size:
+            flush()
+            now = time.perf_counter()
+            if now - last_report >= REPORT_INTERVAL:
+                log(f"{kind}: {done} rows, {(done - skip) / (now - start):.0f} rows/s")
+                last_report = now
+    flush()
+    conn.execute('UPDATE import_progress SET finished = 1, updated_at = ? WHERE source = ?', (time.time(), source))
+    conn.commit()
+    elapsed = time.perf_counter() - start
+    log(f"{kind}: {done - skip} rows read, {inserted} inserted in {elapsed:.1f}s "
+        f"({(done - skip) / elapsed if elapsed else 0:.0f} rows/s)")
+    return inserted
+
+def drop_indexes(conn, indexes=DEFERRED_INDEXES):
+    for name in indexes:
+        conn.execute(f'DROP INDEX IF EXISTS {name}')
+    conn.commit()
+
+def rebuild_derived(conn, log=print):
+    """Recompute everything the write paths normally maintain, after rows were loaded directly."""
+    start = time.perf_counter()
+    profiles.backfill(conn)
+    trending.backfill(conn)
+    aggregates.backfill(conn)
+    # Every stored recommendation list may now be out of date
+    conn.execute('UPDATE user_recommendations SET stale = 1, stale_at = ?', (time.time(),))
+    conn.execute('ANALYZE')
+    conn.commit()
+    log(f"Rebuilt derived tables in {time.perf_counter() - start:.1f}s")
+
+def build_snapshot(snapshot_dir, log=print):
+    """Fit the content model once for the new catalog and save it for the server to memory-map."""
+    from recommender import Recommender
+
+    start = time.perf_counter()
+    rec = Recommender(snapshot_dir=snapshot_dir, save_snapshots=True)
+    log(f"Content model {rec.snapshot_name} ready in {time.perf_counter() - start:.1f}s")
+
+def notify(base_url, log=print):
+    """Ask a running server to reload its model and in-memory aggregates."""
+    req = urllib.request.Request(base_url.rstrip('/') + '/api/admin/refresh', data=b'{}', method='POST',
+                                 headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(req, timeout=600) as resp:
+        log(f"Server refreshed: {resp.read().decode()}")
+
+def run(files, fmt=None, chunk_size=DEFAULT_CHUNK_SIZE, resume=True, snapshot_dir=None, notify_url=None,
+        log=print):
+    """Import {kind: path} in dependency order, then rebuild indexes, derived tables and the model."""
+    conn = get_db_connection()
+    migrate(conn)
+    if not resume:
+        conn.executemany('DELETE FROM import_progress WHERE source = ?',
+                         [(_source_key(kind, path),) for kind, path in files.items()])
+        conn.commit()
+
+    drop_indexes(conn)
+    try:
+        for kind in ORDER:
+            if kind in files:
+                import_file(conn, kind, files[kind], fmt, chunk_size, resume, log)
+    finally:
+        # Indexes come back even if loading stopped part way
+        start = time.perf_counter()
+        conn.rollback()
+        create_indexes(conn, DEFERRED_INDEXES)
+        conn.commit()
+        log(f"Rebuilt indexes in {time.perf_counter() - start:.1f}s")
+
+    rebuild_derived(conn, log)
+    conn.close()
+    if snapshot_dir:
+        build_snapshot(snapshot_dir, log)
+    if notify_url:
+        notify(notify_url, log)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stream JSONL/CSV files into the database.')
+    for kind in ORDER:
+        parser.add_argument(f'--{kind}', metavar='PATH')
+    parser.add_argument('--format', choices=['jsonl', 'csv'], help='default: from the file extension')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--restart', action='store_true', help='ignore recorded progress and load from the start')
+    parser.add_argument('--snapshot-dir', default=snapshot.DEFAULT_DIR,
+                        help="content model snapshot directory ('' to skip the model build)")
+    parser.add_argument('--notify', metavar='URL', help='running server to refresh afterwards')
+    args = parser.parse_args()
+
+    files = {kind: getattr(args, kind) for kind in ORDER if getattr(args, kind)}
+    if not files:
+        parser.error('nothing to import')
+    print(f"Importing into {connections.DB_PATH}")
+    run(files, args.format, args.chunk_size, not args.restart, args.snapshot_dir or None, args.notify)
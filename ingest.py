@@ -0,0 +1,188 @@
+import queue
+import threading
+import time
+
+# Durability modes:
+#   'none'     - ack immediately, writer runs with PRAGMA synchronous=OFF
+#   'buffered' - ack immediately, writer runs with synchronous=NORMAL
+#   'commit'   - the request waits until the batch holding its event has
+#                committed (group commit), writer runs with synchronous=FULL
+DURABILITY_SYNCHRONOUS = {'none': 'OFF', 'buffered': 'NORMAL', 'commit': 'FULL'}
+
+
+class IngestUnavailable(RuntimeError):
+    """The buffer is closed or its writer thread has died; events cannot be accepted."""
+
+
+class IngestBuffer:
+    """Bounded in-memory queue of tracking events drained by a background writer thread.
+
+    `write(conn, interactions, searches)` is called once per flush inside a
+    single transaction (it should use executemany) and returns a list of
+    updates; `after_commit(interactions, searches, updates)` runs once the
+    transaction has committed. If a batch fails it is rolled back and retried
+    one event per transaction, so only the events that fail on their own are
+    dropped. A flush happens when flush_size events are waiting or
+    flush_interval seconds after the first one arrived, whichever comes first.
+    """
+
+    def __init__(self, connect, write, after_commit=None, max_queue=10000, flush_size=500,
+                 flush_interval=0.2, durability='buffered', put_timeout=1.0, commit_timeout=10.0):
+        if durability not in DURABILITY_SYNCHRONOUS:
+            raise ValueError(f'Unknown durability mode: {durability}')
+        self.connect = connect
+        self.write = write
+        self.after_commit = after_commit
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.durability = durability
+        self.put_timeout = put_timeout
+        self.commit_timeout = commit_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closing = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {
+            'flushes': 0,
+            'interactions_written': 0,
+            'searches_written': 0,
+            'errors': 0,
+            'events_dropped': 0,
+            'after_commit_errors': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+        }
+        self._thread = threading.Thread(target=self._run, name='ingest-writer', daemon=True)
+        self._thread.start()
+
+    def submit_interaction(self, user_id, movie_id, interaction_type, watch_time):
+        self._submit('interaction', (user_id, movie_id, interaction_type, watch_time))
+
+    def submit_search(self, user_id, query):
+        self._submit('search', (user_id, query))
+
+    def _submit(self, kind, row):
+        """Queue one event.
+
+        Raises queue.Full if the writer cannot keep up, IngestUnavailable once
+        closed or if the writer died, and in 'commit' mode TimeoutError when
+        the event is not committed within commit_timeout (it may still be).
+        """
+        if self._closing.is_set():
+            raise IngestUnavailable('Ingest buffer is closed')
+        if not self._thread.is_alive():
+            raise IngestUnavailable('Ingest writer is not running')
+        done = threading.Event() if self.durability == 'commit' else None
+        item = {'kind': kind, 'row': row, 'done': done, 'error': None}
+        self._queue.put(item, timeout=self.put_timeout)
+        if done is not None:
+            if not done.wait(self.commit_timeout):
+                raise TimeoutError(f'Event not committed within {self.commit_timeout}s')
+            if item['error'] is not None:
+                raise item['error']
+
+    def close(self):
+        """Stop accepting events, flush everything still queued and stop the writer."""
+        self._closing.set()
+        self._thread.join()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        flushes = stats.pop('total_flush_ms')
+        stats['avg_flush_ms'] = round(flushes / stats['flushes'], 3) if stats['flushes'] else 0.0
+        stats['queue_depth'] = self._queue.qsize()
+        stats['max_queue'] = self._queue.maxsize
+        stats['durability'] = self.durability
+        stats['writer_alive'] = self._thread.is_alive()
+        return stats
+
+    def _run(self):
+        conn = self.connect()
+        conn.execute(f'PRAGMA synchronous = {DURABILITY_SYNCHRONOUS[self.durability]}')
+        try:
+            while not (self._closing.is_set() and self._queue.empty()):
+                batch = self._collect()
+                if not batch:
+                    continue
+                try:
+                    self._flush(conn, batch)
+                except Exception as e:
+                    # Keep the writer alive; waiters get the error instead of hanging
+                    print(f"Ingest flush crashed, dropped {len(batch)} events: {e}")
+                    with self._lock:
+                        self._stats['errors'] += 1
+                        self._stats['events_dropped'] += len(batch)
+                    self._finish(batch, e)
+        finally:
+            conn.close()
+
+    def _collect(self):
+        # When closing, drain without waiting on timers
+        wait = 0.0 if self._closing.is_set() else self.flush_interval
+        try:
+            batch = [self._queue.get(timeout=wait) if wait else self._queue.get_nowait()]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + wait
+        while len(batch) < self.flush_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, conn, batch):
+        start = time.perf_counter()
+        written, updates, error = self._write(conn, batch)
+        if error is not None:
+            # Retry one event per transaction so a single bad event only drops itself
+            print(f"Ingest flush failed, retrying {len(batch)} events one by one: {error}")
+            written, updates = [], []
+            for item in batch:
+                ok, item_updates, item['error'] = self._write(conn, [item])
+                written += ok
+                updates += item_updates
+        elapsed = (time.perf_counter() - start) * 1000
+
+        interactions = [item['row'] for item in written if item['kind'] == 'interaction']
+        searches = [item['row'] for item in written if item['kind'] == 'search']
+        after_commit_error = None
+        if written and self.after_commit is not None:
+            try:
+                self.after_commit(interactions, searches, updates)
+            except Exception as e:
+                after_commit_error = e
+                print(f"Ingest after_commit failed: {e}")
+        with self._lock:
+            self._stats['flushes'] += 1
+            self._stats['last_flush_ms'] = round(elapsed, 3)
+            self._stats['max_flush_ms'] = max(self._stats['max_flush_ms'], round(elapsed, 3))
+            self._stats['total_flush_ms'] += elapsed
+            self._stats['interactions_written'] += len(interactions)
+            self._stats['searches_written'] += len(searches)
+            if error is not None:
+                self._stats['errors'] += 1
+                self._stats['events_dropped'] += len(batch) - len(written)
+            if after_commit_error is not None:
+                self._stats['after_commit_errors'] += 1
+        self._finish(batch)
+
+    def _write(self, conn, batch):
+        """(written items, updates, error) for one transaction holding batch."""
+        try:
+            updates = self.write(conn, [item['row'] for item in batch if item['kind'] == 'interaction'],
+                                 [item['row'] for item in batch if item['kind'] == 'search'])
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            return [], [], e
+        return batch, list(updates or ()), None
+
+    def _finish(self, batch, error=None):
+        for item in batch:
+            if error is not None:
+                item['error'] = error
+            if item['done'] is not None:
+                item['done'].set()
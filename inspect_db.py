@@ -1,10 +1,9 @@
-import sqlite3
 import pandas as pd
 
-DB_NAME = 'netflix_rec.db'
+import connections
 
 def inspect():
-    conn = sqlite3.connect(DB_NAME)
+    conn = connections.connect(readonly=True)
     
     print("=== USERS ===")
     print(pd.read_sql('SELECT * FROM users', conn))
@@ -0,0 +1,241 @@
+"""Record real API traffic and replay it against a server under load.
+
+Recording: start the app with NETFLIX_REC_TRACE=trace.jsonl and every /api
+request is appended to that file (method, path, JSON body, status, time).
+Password fields are redacted, so replayed logins answer 401.
+
+Replaying:
+    python loadtest.py replay trace.jsonl --concurrency 16           # closed loop, as fast as possible
+    python loadtest.py replay trace.jsonl --rate 200 --duration 60   # open loop, fixed arrivals per second
+
+Reports per-endpoint throughput, p50/p95/p99 latency and error rates.
+"""
+import argparse
+import http.client
+import json
+import re
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+DEFAULT_BASE_URL = 'http://127.0.0.1:5000'
+# Numeric path segments are folded so /api/history/1 and /api/history/2 report together
+_ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+# Body keys whose values never reach the trace file (matched case-insensitively)
+SECRET_KEYS = ('password',)
+REDACTED = '[redacted]'
+
+def redact(body):
+    """Copy of a JSON body with the values of secret keys replaced, at any depth."""
+    if isinstance(body, dict):
+        return {k: REDACTED if any(s in k.lower() for s in SECRET_KEYS) else redact(v) for k, v in body.items()}
+    if isinstance(body, list):
+        return [redact(v) for v in body]
+    return body
+
+class TraceRecorder:
+    """Flask hook appending one JSON line per API request to a trace file."""
+
+    def __init__(self, path, prefix='/api/'):
+        self.path = path
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def init_app(self, app):
+        from flask import g, request
+
+        @app.before_request
+        def start_trace():
+            g.trace_started = time.perf_counter()
+
+        @app.after_request
+        def write_trace(response):
+            if request.path.startswith(self.prefix) and 'trace_started' in g:
+                self.write({
+                    'ts': time.time(),
+                    'method': request.method,
+                    'path': request.full_path.rstrip('?'),
+                    'body': redact(request.get_json(silent=True)),
+                    'status': response.status_code,
+                    'duration_ms': round((time.perf_counter() - g.trace_started) * 1000, 3),
+                })
+            return response
+
+    def write(self, entry):
+        line = json.dumps(entry, separators=(',', ':')) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+def load_trace(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def endpoint(entry):
+    path = urllib.parse.urlsplit(entry['path']).path
+    return f"{entry['method']} {_ID_SEGMENT.sub('/<id>', path)}"
+
+class Client:
+    """Keep-alive HTTP connection per thread."""
+
+    def __init__(self, base_url, timeout=30.0):
+        parts = urllib.parse.urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def request(self, entry):
+        """Send one traced request; returns the status code (raises on connection errors)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        body = None
+        headers = {}
+        if entry.get('body') is not None:
+            body = json.dumps(entry['body'])
+            headers['Content-Type'] = 'application/json'
+        try:
+            conn.request(entry['method'], entry['path'], body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self._local.conn = None
+            raise
+
+class Results:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.started = self.finished = None
+
+    def add(self, name, latency, status):
+        with self._lock:
+            self.samples.setdefault(name, []).append((latency, status))
+
+    def report(self):
+        """Per-endpoint (and overall) stats; an error is a failed connection or a 5xx status."""
+        elapsed = max(self.finished - self.started, 1e-9)
+        rows = {}
+        everything = []
+        for name, samples in sorted(self.samples.items()):
+            rows[name] = _stats(samples, elapsed)
+            everything.extend(samples)
+        rows['ALL'] = _stats(everything, elapsed)
+        return {'elapsed_s': round(elapsed, 3), 'endpoints': rows}
+
+def _stats(samples, elapsed):
+    if not samples:
+        return {'requests': 0}
+    latencies = np.array([s[0] for s in samples]) * 1000
+    statuses = [s[1] for s in samples]
+    errors = sum(1 for s in statuses if s is None or s >= 500)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        'requests': len(samples),
+        'throughput_rps': round(len(samples) / elapsed, 1),
+        'p50_ms': round(float(p50), 2),
+        'p95_ms': round(float(p95), 2),
+        'p99_ms': round(float(p99), 2),
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 4),
+        'client_errors': sum(1 for s in statuses if s is not None and 400 <= s < 500),
+    }
+
+def _send(client, results, entry, scheduled=None):
+    # In open-loop mode latency counts from the scheduled send time, so a
+    # backed-up server is not hidden by requests that started late
+    start = time.perf_counter() if scheduled is None else scheduled
+    try:
+        status = client.request(entry)
+    except (OSError, http.client.HTTPException):
+        status = None
+    results.add(endpoint(entry), time.perf_counter() - start, status)
+
+def replay_closed(entries, client, concurrency, repeat=1):
+    """Every worker sends its next request as soon as the previous one answers."""
+    results = Results()
+    work = [entry for _ in range(repeat) for entry in entries]
+    cursor = iter(work)
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                entry = next(cursor, None)
+            if entry is None:
+                return
+            _send(client, results, entry)
+
+    results.started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    results.finished = time.perf_counter()
+    return results
+
+def replay_open(entries, client, rate, duration=None, max_workers=256):
+    """Requests start at a fixed rate per second, cycling through the trace, whatever the latency."""
+    total = int(rate * duration) if duration else len(entries)
+    results = Results()
+    results.started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for i in range(total):
+            scheduled = results.started + i / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(_send, client, results, entries[i % len(entries)], scheduled)
+    results.finished = time.perf_counter()
+    return results
+
+def print_report(report):
+    print(f"{'endpoint':<40} {'reqs':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for name, row in report['endpoints'].items():
+        if not row['requests']:
+            continue
+        print(f"{name:<40} {row['requests']:>7} {row['throughput_rps']:>8.1f} {row['p50_ms']:>8.2f} "
+              f"{row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f} {row['error_rate']:>6.1%}")
+    print(f"Elapsed: {report['elapsed_s']}s")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay a recorded API trace against a running server.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    replay = sub.add_parser('replay')
+    replay.add_argument('trace')
+    replay.add_argument('--base-url', default=DEFAULT_BASE_URL)
+    replay.add_argument('--concurrency', type=int, default=8, help='closed-loop workers')
+    replay.add_argument('--repeat', type=int, default=1, help='closed loop: passes over the trace')
+    replay.add_argument('--rate', type=float, help='open loop: requests started per second')
+    replay.add_argument('--duration', type=float, help='open loop: seconds to run (default: one pass)')
+    replay.add_argument('--include-writes', action='store_true',
+                        help='also replay POST requests (they add events to the database)')
+    replay.add_argument('--json', metavar='PATH', help='also write the report as JSON')
+    args = parser.parse_args()
+
+    entries = load_trace(args.trace)
+    if not args.include_writes:
+        entries = [e for e in entries if e['method'] == 'GET']
+    if not entries:
+        parser.error('no requests to replay')
+    client = Client(args.base_url)
+    if args.rate:
+        results = replay_open(entries, client, args.rate, args.duration)
+    else:
+        results = replay_closed(entries, client, args.concurrency, args.repeat)
+    report = results.report()
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,135 @@
+import json
+import sys
+import threading
+import time
+import zlib
+
+from database import get_db_connection, migrate
+
+# Entries older than this are recomputed even if no event marked them stale,
+# so collaborative signals from other users eventually show up.
+DEFAULT_MAX_AGE = 6 * 3600
+
+def model_version(recommender):
+    """Catalog version the stored lists were computed against (stable across processes)."""
+    return zlib.crc32(repr(recommender.movies_fingerprint).encode())
+
+def model_watermarks(recommender):
+    """(interaction, search) ids the active model has seen; read before computing, as a lower bound."""
+    model = recommender.model
+    return model.interaction_watermark, model.search_watermark
+
+def get_fresh(conn, user_id, version, max_age=DEFAULT_MAX_AGE):
+    """Stored recommendations for user_id, or None if missing, stale, expired or from another version."""
+    row = conn.execute('SELECT payload, version, computed_at, stale FROM user_recommendations WHERE user_id = ?',
+                       (user_id,)).fetchone()
+    if row is None or row[3] or row[1] != version or time.time() - row[2] > max_age:
+        return None
+    return json.loads(row[0])
+
+def store(conn, user_id, recs, version, started, watermarks=(0, 0)):
+    """Upsert one user's list computed by a model that had seen `watermarks` (see model_watermarks).
+
+    `started` is when computing began. The entry stays stale if it was
+    marked after that, or if the event behind the mark is newer than the
+    model: the list is still served, and recomputed once a model with the
+    event is swapped in.
+    """
+    conn.execute('''
+        INSERT INTO user_recommendations (user_id, payload, version, computed_at, stale,
+                                          interaction_watermark, search_watermark)
+        VALUES (?, ?, ?, ?, 0, ?, ?)
+        ON CONFLICT (user_id) DO UPDATE SET
+            payload = excluded.payload,
+            version = excluded.version,
+            computed_at = excluded.computed_at,
+            interaction_watermark = excluded.interaction_watermark,
+            search_watermark = excluded.search_watermark,
+            stale = CASE WHEN stale_at > excluded.computed_at
+                           OR COALESCE(stale_interaction, 0) > excluded.interaction_watermark
+                           OR COALESCE(stale_search, 0) > excluded.search_watermark
+                         THEN 1 ELSE 0 END
+    ''', (user_id, json.dumps(recs), version, started, *watermarks))
+
+def mark_stale(conn, user_id):
+    """Flag one user's stored list for recomputation (write paths call this after inserting; caller commits).
+
+    Records the newest interaction and search ids, which include the
+    triggering event, so only a model that has seen them clears the flag.
+    """
+    conn.execute('''
+        UPDATE user_recommendations SET stale = 1, stale_at = ?,
+            stale_interaction = (SELECT MAX(id) FROM interactions),
+            stale_search = (SELECT MAX(id) FROM search_history)
+        WHERE user_id = ?
+    ''', (time.time(), user_id))
+
+def stale_users(conn, watermarks, limit):
+    """Stale users whose triggering events the model with `watermarks` has already seen."""
+    return [row[0] for row in conn.execute('''
+        SELECT user_id FROM user_recommendations
+        WHERE stale = 1 AND COALESCE(stale_interaction, 0) <= ? AND COALESCE(stale_search, 0) <= ?
+        LIMIT ?
+    ''', (*watermarks, limit))]
+
+def precompute(recommender, conn, user_ids, batch_size=256):
+    """Compute and store recommendations for user_ids in batches; returns the number stored."""
+    count = 0
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        started = time.time()
+        watermarks = model_watermarks(recommender)
+        version = model_version(recommender)
+        results = list(recommender.recommend_many(batch))
+        for user_id, recs in results:
+            store(conn, user_id, recs, version, started, watermarks)
+        conn.commit()
+        count += len(results)
+    return count
+
+
+class RecomputeWorker(threading.Thread):
+    """Background thread that recomputes stale users in batches.
+
+    Users wait until the active model has seen the events that marked them
+    stale, so nothing is recomputed on a model that would give the same list.
+    """
+
+    def __init__(self, recommender, interval=5.0, batch_size=256):
+        super().__init__(name='recompute-worker', daemon=True)
+        self.recommender = recommender
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop_event = threading.Event()
+
+    def run(self):
+        conn = get_db_connection()
+        try:
+            while not self._stop_event.is_set():
+                user_ids = stale_users(conn, model_watermarks(self.recommender), self.batch_size)
+                if user_ids:
+                    try:
+                        precompute(self.recommender, conn, user_ids, self.batch_size)
+                    except Exception as e:
+                        conn.rollback()
+                        print(f"Recompute worker error: {e}")
+                if len(user_ids) < self.batch_size:
+                    self._stop_event.wait(self.interval)
+        finally:
+            conn.close()
+
+    def stop(self):
+        self._stop_event.set()
+
+if __name__ == '__main__':
+    # python materialized.py precompute [user_id ...]   (no ids: every user)
+    if len(sys.argv) < 2 or sys.argv[1] != 'precompute':
+        print('usage: python materialized.py precompute [user_id ...]')
+        sys.exit(1)
+    from recommender import Recommender
+    conn = get_db_connection()
+    migrate(conn)
+    user_ids = [int(u) for u in sys.argv[2:]] or [row[0] for row in conn.execute('SELECT id FROM users')]
+    count = precompute(Recommender(), conn, user_ids)
+    conn.close()
+    print(f"Stored recommendations for {count} users.")
@@ -0,0 +1,162 @@
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implicit
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Fraction of timed sections that are actually measured (1.0 = all). Counts
+# in sampled histograms are therefore a sample, not totals.
+DEFAULT_SAMPLE_RATE = 1.0
+
+HELP = {
+    'http_request_duration_seconds': 'Flask route latency, by route and method.',
+    'http_requests_total': 'Requests handled, by route, method and status.',
+    'recommender_stage_seconds': 'Time spent in each stage of building recommendations.',
+}
+
+class Histogram:
+    """Fixed-bucket latency histogram (cumulative counts are computed on export)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+    def quantile(self, q, counts=None, count=None):
+        """Estimate of the q-quantile, interpolating linearly inside the bucket it falls in."""
+        if counts is None:
+            counts, _, count = self.snapshot()
+        if not count:
+            return None
+        rank = q * count
+        seen = 0
+        for i, c in enumerate(counts):
+            if seen + c >= rank and c:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                if i == len(self.buckets):
+                    # Overflow bucket: no upper bound to interpolate towards
+                    return self.buckets[-1]
+                return lower + (self.buckets[i] - lower) * (rank - seen) / c
+            seen += c
+        return self.buckets[-1]
+
+class Registry:
+    """Named, labelled histograms and counters with sampled timers."""
+
+    def __init__(self, sample_rate=DEFAULT_SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        hist = self._histograms.get(key)
+        if hist is None:
+            with self._lock:
+                hist = self._histograms.setdefault(key, Histogram())
+        return hist
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def sampled(self):
+        rate = self.sample_rate
+        return rate >= 1.0 or (rate > 0 and random.random() < rate)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Time the block into histogram `name` (only for the sampled fraction of calls)."""
+        if not self.sampled():
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.histogram(name, **labels).observe(time.perf_counter() - start)
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+            self._counters = {}
+
+    def render_prometheus(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines += _header(name, 'counter')
+                typed.add(name)
+            lines.append(f'{name}{_labels(labels)} {value}')
+        for (name, labels), hist in histograms:
+            if name not in typed:
+                lines += _header(name, 'histogram')
+                typed.add(name)
+            counts, total, count = hist.snapshot()
+            cumulative = 0
+            for bound, c in zip(list(hist.buckets) + ['+Inf'], counts):
+                cumulative += c
+                lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f'{name}_sum{_labels(labels)} {total}')
+            lines.append(f'{name}_count{_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """JSON-friendly view: per histogram count, mean and p50/p95/p99 in milliseconds."""
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+        out = {'sample_rate': self.sample_rate, 'histograms': [], 'counters': []}
+        for (name, labels), hist in histograms:
+            counts, total, count = hist.snapshot()
+            row = {'name': name, 'labels': dict(labels), 'count': count,
+                   'mean_ms': round(total / count * 1000, 3) if count else None}
+            for q in (0.5, 0.95, 0.99):
+                value = hist.quantile(q, counts, count)
+                row[f'p{int(q * 100)}_ms'] = None if value is None else round(value * 1000, 3)
+            out['histograms'].append(row)
+        for (name, labels), value in counters:
+            out['counters'].append({'name': name, 'labels': dict(labels), 'value': value})
+        return out
+
+def _header(name, kind):
+    lines = [f'# HELP {name} {HELP[name]}'] if name in HELP else []
+    return lines + [f'# TYPE {name} {kind}']
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+# Process-wide registry used by the app and the recommender
+registry = Registry()
+
+def configure(sample_rate=DEFAULT_SAMPLE_RATE):
+    registry.sample_rate = sample_rate
+
+def stage(name):
+    """Timer for one stage of recommendation work."""
+    return registry.timer('recommender_stage_seconds', stage=name)
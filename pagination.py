@@ -0,0 +1,71 @@
+import base64
+import json
+
+# Page size for list endpoints: ?limit= defaults to DEFAULT_PAGE_SIZE and is
+# never allowed above MAX_PAGE_SIZE
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+class PageError(ValueError):
+    """A bad limit, cursor or fields parameter (answered with 400)."""
+
+def page_size(value, default=DEFAULT_PAGE_SIZE, cap=MAX_PAGE_SIZE):
+    if value is None:
+        return default
+    try:
+        size = int(value)
+    except ValueError:
+        raise PageError('limit must be an integer')
+    if size < 1:
+        raise PageError('limit must be at least 1')
+    return min(size, cap)
+
+def encode_cursor(values):
+    """Opaque token for the sort key of the last row on a page."""
+    return base64.urlsafe_b64encode(json.dumps(list(values), separators=(',', ':')).encode()).decode().rstrip('=')
+
+def decode_cursor(token, length):
+    """The sort key from encode_cursor, or None for a missing/empty token."""
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except ValueError:
+        raise PageError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != length:
+        raise PageError('Invalid cursor')
+    # Only scalars can be bound as query parameters
+    if any(isinstance(v, bool) or not isinstance(v, (int, float, str, type(None))) for v in values):
+        raise PageError('Invalid cursor')
+    return values
+
+def parse_fields(value, columns, default=None):
+    """Columns named in a comma-separated ?fields= value (all of `default`, or `columns`, if absent).
+
+    `columns` maps each field a client may ask for to the SQL expression
+    that selects it; returns a SELECT list.
+    """
+    if value:
+        names = [f.strip() for f in value.split(',') if f.strip()]
+        unknown = [f for f in names if f not in columns]
+        if unknown:
+            raise PageError(f"Unknown fields: {', '.join(unknown)}")
+    else:
+        names = list(default or columns)
+    return ', '.join(f'{columns[name]} AS {name}' for name in dict.fromkeys(names))
+
+def page(rows, limit, key_columns):
+    """Split rows fetched with LIMIT limit + 1 into (page, next_cursor).
+
+    key_columns name the hidden keyset columns selected alongside the
+    requested fields; they are stripped from the returned rows.
+    """
+    rows = [dict(row) for row in rows]
+    next_cursor = ''
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][k] for k in key_columns)
+    for row in rows:
+        for k in key_columns:
+            row.pop(k, None)
+    return rows, next_cursor
@@ -0,0 +1,195 @@
+import re
+import sys
+import threading
+from bisect import bisect_right
+
+from database import get_db_connection
+
+# Scoring rules shared by write-time updates, backfills and Recommender.calculate_genre_profile
+LIKE_POINTS = 10
+SEARCH_POINTS = 5
+WATCH_POINTS_PER_MINUTE = 3
+MAX_WATCH_POINTS = 30
+
+def interaction_points(interaction_type, watch_time):
+    points = 0
+    if interaction_type == 'like':
+        points += LIKE_POINTS
+    elif interaction_type == 'watch':
+        # +3 points for every minute watched, up to max 30
+        minutes = (watch_time or 0) / 60
+        if minutes > 1:
+            points += min(int(minutes * WATCH_POINTS_PER_MINUTE), MAX_WATCH_POINTS)
+    return points
+
+class GenreMatcher:
+    """Finds which genres occur, case-insensitively, as substrings of search queries.
+
+    Same answer as `genre.lower() in query.lower()` for every genre, but all
+    genres are matched in one compiled regex scan: a lookahead alternation
+    reports the longest genre starting at each position, and every genre that
+    is a substring of a matched one is implied by it. Build once per catalog.
+    """
+
+    SEPARATOR = '\x00'
+
+    def __init__(self, genres):
+        self.genres = sorted(set(genres))
+        by_key = {}
+        for g in self.genres:
+            by_key.setdefault(g.lower(), []).append(g)
+        # An empty genre name is "in" every query
+        self._always = by_key.pop('', [])
+        self._by_key = by_key
+        keys = sorted(by_key, key=len, reverse=True)
+        self._implied = {k: [o for o in keys if o in k] for k in keys}
+        self._pattern = re.compile('(?=(' + '|'.join(map(re.escape, keys)) + '))') if keys else None
+
+    def match(self, query):
+        return self.match_many([query])[0]
+
+    def match_many(self, queries):
+        """Matched genres for each query, scanning the whole batch in one pass."""
+        queries = [q.lower() for q in queries]
+        found = [set() for _ in queries]
+        if self._pattern is not None and queries:
+            starts = []
+            offset = 0
+            for q in queries:
+                starts.append(offset)
+                offset += len(q) + 1
+            for m in self._pattern.finditer(self.SEPARATOR.join(queries)):
+                found[bisect_right(starts, m.start()) - 1].update(self._implied[m.group(1)])
+        return [self._always + [g for key in keys for g in self._by_key[key]] for keys in found]
+
+    def count(self, queries):
+        """How many of the queries mention each genre (a query counts a genre once)."""
+        counts = {}
+        for genres in self.match_many(queries):
+            for g in genres:
+                counts[g] = counts.get(g, 0) + 1
+        return counts
+
+def catalog_genres(conn):
+    genres = set()
+    for row in conn.execute('SELECT DISTINCT genre FROM movies'):
+        genres.update(row[0].split('|'))
+    return genres
+
+def compute_profiles(conn, user_ids=None):
+    """Score genre profiles from scratch out of interactions and search history."""
+    movie_genres = {row[0]: row[1].split('|') for row in conn.execute('SELECT id, genre FROM movies')}
+    matcher = GenreMatcher(catalog_genres(conn))
+    where, params = '', ()
+    if user_ids is not None:
+        user_ids = [int(u) for u in user_ids]
+        where = f" WHERE user_id IN ({','.join('?' * len(user_ids))})"
+        params = tuple(user_ids)
+
+    profiles = {}
+    for user_id, movie_id, interaction_type, watch_time in conn.execute(
+            'SELECT user_id, movie_id, interaction_type, watch_time FROM interactions' + where, params):
+        if movie_id not in movie_genres:
+            continue
+        scores = profiles.setdefault(user_id, {})
+        points = interaction_points(interaction_type, watch_time)
+        for g in movie_genres[movie_id]:
+            scores[g] = scores.get(g, 0) + points
+
+    searches = conn.execute('SELECT user_id, query FROM search_history' + where, params).fetchall()
+    for (user_id, _), matched in zip(searches, matcher.match_many([q for _, q in searches])):
+        scores = profiles.setdefault(user_id, {})
+        for g in matched:
+            scores[g] = scores.get(g, 0) + SEARCH_POINTS
+    return profiles
+
+
+class GenreProfileStore:
+    """Per-user genre scores kept in `user_genre_profile` with an in-memory mirror.
+
+    Write paths call record_interaction / record_search with the request's
+    connection, so the profile rows commit together with the event itself.
+    Both return a function that applies the same change to the mirror; call
+    it only once the transaction has committed, so a rollback never leaves
+    the mirror ahead of the table. Reads (get) never touch SQLite.
+
+    load() bumps a generation; an update recorded before the reload is
+    already in the reloaded rows and is skipped. This relies on load()
+    running under the database write lock (connections.write_locked) while
+    writes are possible, so no write can sit between its SQL and commit.
+    """
+
+    def __init__(self):
+        self._profiles = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.loaded = False
+
+    def load(self, conn):
+        """Replace the mirror with the stored profiles (left unloaded if the table is not migrated yet)."""
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='user_genre_profile'").fetchone():
+            return
+        profiles = {}
+        for user_id, genre, score in conn.execute('SELECT user_id, genre, score FROM user_genre_profile'):
+            profiles.setdefault(user_id, {})[genre] = score
+        with self._lock:
+            self._profiles = profiles
+            self._generation += 1
+        self.loaded = True
+
+    def get(self, user_id):
+        with self._lock:
+            return dict(self._profiles.get(int(user_id), {}))
+
+    def record_interaction(self, conn, user_id, genres, interaction_type, watch_time=0):
+        points = interaction_points(interaction_type, watch_time)
+        deltas = {}
+        for g in genres:
+            # A genre listed twice on a movie scores twice, like the full recomputation
+            deltas[g] = deltas.get(g, 0) + points
+        return self._add(conn, int(user_id), deltas)
+
+    def record_search(self, conn, user_id, query, matcher):
+        return self._add(conn, int(user_id), {g: SEARCH_POINTS for g in matcher.match(query)})
+
+    def _add(self, conn, user_id, deltas):
+        """Upsert the score deltas; returns the matching mirror update to run after commit."""
+        if not deltas:
+            return lambda: None
+        conn.executemany('''
+            INSERT INTO user_genre_profile (user_id, genre, score) VALUES (?, ?, ?)
+            ON CONFLICT (user_id, genre) DO UPDATE SET score = score + excluded.score
+        ''', [(user_id, g, d) for g, d in deltas.items()])
+        generation = self._generation
+
+        def apply():
+            with self._lock:
+                if generation != self._generation:
+                    return
+                scores = self._profiles.setdefault(user_id, {})
+                for g, d in deltas.items():
+                    scores[g] = scores.get(g, 0) + d
+        return apply
+
+
+def backfill(conn, user_ids=None):
+    """Rebuild stored profiles from history (all users, or just user_ids). Caller commits."""
+    profiles = compute_profiles(conn, user_ids)
+    if user_ids is None:
+        conn.execute('DELETE FROM user_genre_profile')
+    else:
+        conn.executemany('DELETE FROM user_genre_profile WHERE user_id = ?', [(int(u),) for u in user_ids])
+    conn.executemany('INSERT INTO user_genre_profile (user_id, genre, score) VALUES (?, ?, ?)',
+                     [(u, g, s) for u, scores in profiles.items() for g, s in scores.items()])
+    return len(profiles)
+
+if __name__ == '__main__':
+    # python profiles.py backfill [user_id ...]
+    if len(sys.argv) < 2 or sys.argv[1] != 'backfill':
+        print('usage: python profiles.py backfill [user_id ...]')
+        sys.exit(1)
+    conn = get_db_connection()
+    count = backfill(conn, [int(u) for u in sys.argv[2:]] or None)
+    conn.commit()
+    conn.close()
+    print(f"Backfilled genre profiles for {count} users.")
@@ -1,205 +1,888 @@
-import sqlite3
+import copy
+import hashlib
+import os
+import threading
+import time
+import numpy as np
 import pandas as pd
+from scipy import sparse
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import linear_kernel
 
-DB_NAME = 'netflix_rec.db'
+import als
+import ann
+import connections
+import metrics
+import snapshot
+from profiles import SEARCH_POINTS, GenreMatcher, GenreProfileStore, interaction_points
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    return conn
+# Neighbors kept per movie in the content index, and rows scored per block
+# while building it (each block materializes a block_size x N dense slice).
+NEIGHBOR_K = 50
+NEIGHBOR_BLOCK = 256
+# The ANN content index is extended in place while the movies added since
+# its k-means fit stay under this share of the catalog, then rebuilt
+ANN_REBUILD_FRACTION = 0.2
+
+def catalog_version(conn):
+    """Counter bumped by triggers on every insert, update or delete in movies (see database.py)."""
+    return conn.execute('SELECT version FROM catalog_version').fetchone()[0]
+
+def movies_fingerprint(movies):
+    """Content hash of a movies frame as read from the table (same rows, order and values hash equal)."""
+    hashes = pd.util.hash_pandas_object(movies, index=False).to_numpy()
+    return hashlib.sha1(','.join(movies.columns).encode() + hashes.tobytes()).hexdigest()
+
+def movie_records(frame):
+    """Rows of a movies frame as dicts for JSON responses; missing values (NaN) become None."""
+    return frame.astype(object).where(frame.notna(), None).to_dict('records')
+
+def build_neighbor_index(tfidf_matrix, top_k=NEIGHBOR_K, block_size=NEIGHBOR_BLOCK):
+    """Sparse N x N matrix holding only the top_k cosine neighbors (and scores) of each movie.
+
+    Similarities are computed block by block from the sparse TF-IDF rows, so
+    memory stays at O(N * top_k) plus one block_size x N slice.
+    """
+    tfidf_matrix = sparse.csr_matrix(tfidf_matrix)
+    n = tfidf_matrix.shape[0]
+    k = max(min(top_k, n - 1), 0)
+    tfidf_t = tfidf_matrix.T.tocsc()
+
+    indptr = [0]
+    indices = []
+    data = []
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        block = (tfidf_matrix[start:stop] @ tfidf_t).toarray()
+        # A movie is never its own neighbor
+        block[np.arange(stop - start), np.arange(start, stop)] = 0.0
+        if k:
+            top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        else:
+            top = np.empty((stop - start, 0), dtype=np.int64)
+        order = np.argsort(top, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        scores = np.take_along_axis(block, top, axis=1)
+        keep = scores > 0
+        indices.append(top[keep])
+        data.append(scores[keep])
+        indptr.extend(indptr[-1] + np.cumsum(keep.sum(axis=1)))
+
+    indices = np.concatenate(indices) if indices else np.empty(0, dtype=np.int64)
+    data = np.concatenate(data) if data else np.empty(0)
+    return sparse.csr_matrix((data, indices.astype(np.int32), np.asarray(indptr)), shape=(n, n))
+
+def top_rows(scores, top_n):
+    """Indices of the top_n scores, highest first, ties broken by lower index.
+
+    Uses a partial selection (np.partition) instead of sorting every score.
+    """
+    if top_n <= 0:
+        return np.empty(0, dtype=np.int64)
+    if top_n >= len(scores):
+        return np.lexsort((np.arange(len(scores)), -scores))
+    kth = np.partition(scores, len(scores) - top_n)[len(scores) - top_n]
+    above = np.flatnonzero(scores > kth)
+    ties = np.flatnonzero(scores == kth)[:top_n - len(above)]
+    top = np.concatenate([above, ties])
+    return top[np.lexsort((top, -scores[top]))]
+
+def build_genre_index(genre_strings):
+    """Movie x genre structures for '|'-joined genre strings.
+
+    Returns (names, matrix, indptr, sequence): sorted distinct genre names;
+    a CSR count matrix (a genre listed twice on a movie counts twice); and
+    each movie's genre columns in their original order, as
+    sequence[indptr[row]:indptr[row + 1]].
+    """
+    split = [g.split('|') for g in genre_strings]
+    names = sorted({g for genres in split for g in genres})
+    column = {g: i for i, g in enumerate(names)}
+    lengths = np.fromiter((len(genres) for genres in split), dtype=np.int64, count=len(split))
+    indptr = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+    sequence = np.fromiter((column[g] for genres in split for g in genres), dtype=np.int64, count=int(indptr[-1]))
+    matrix = sparse.csr_matrix((np.ones(len(sequence)), sequence.copy(), indptr.copy()),
+                               shape=(len(split), len(names)))
+    matrix.sum_duplicates()
+    return names, matrix, indptr, sequence
+
+def _resize(matrix, shape):
+    matrix = matrix.copy()
+    matrix.resize(shape)
+    return matrix
+
+def _interest_lists(user_inter):
+    """(strong-interest movie ids, all interacted movie ids) for one user's interactions."""
+    strong_interest = user_inter[
+         (user_inter['interaction_type'] == 'like') | 
+         ((user_inter['interaction_type'] == 'watch') & (user_inter['watch_time'] > 300))
+    ]['movie_id'].tolist()
+    return strong_interest, user_inter['movie_id'].tolist()
+
+def _max_id(frame):
+    return int(frame['id'].max()) if not frame.empty else 0
+
+class RecommenderModel:
+    """One complete, immutable version of the recommendation state.
+
+    Holds the catalog, the content index, the interaction matrices and the
+    watermarks they were built up to. A model is fully built before it is
+    published and is never mutated afterwards, so a request that grabbed it
+    keeps a consistent view even if a newer version is swapped in meanwhile.
+    """
+
+    def __init__(self, version, neighbor_k=NEIGHBOR_K, profiles=None, snapshot_dir=None, save_snapshots=False,
+                 als_path=None, ann_nprobe=None):
+        self.version = version
+        self.neighbor_k = neighbor_k
+        # Live per-user genre profiles (not versioned with the model)
+        self.profiles = profiles if profiles is not None else GenreProfileStore()
+        self.snapshot_dir = snapshot_dir
+        self.save_snapshots = save_snapshots
+        self.snapshot_name = None
+        # catalog_version counter value the movies frame was read at (None for in-memory frames)
+        self.catalog_version = None
+        # Trained ALS factors (see als.py) add a third candidate source when present
+        self.als_path = als_path
+        self.als_factors = self.als_items = self.als_gram = self.als_mtime = None
+        # With ann_nprobe set, content candidates come from an IVF index probing that many lists
+        self.ann_nprobe = ann_nprobe
+        self.ann_index = self.ann_svd = self.ann_vectorizer = None
+        self.built_at = time.time()
+
+    @classmethod
+    def build(cls, movies, interactions, searches, fingerprint, version, catalog_version=None, **kwargs):
+        """A model built from scratch out of full movies / interactions / searches frames."""
+        model = cls(version, **kwargs)
+        model.catalog_version = catalog_version
+        if interactions is None:
+            interactions = pd.DataFrame(columns=['id', 'user_id', 'movie_id', 'interaction_type',
+                                                 'watch_time', 'timestamp'])
+        if searches is None:
+            searches = pd.DataFrame(columns=['id', 'user_id', 'query', 'timestamp'])
+        model.interactions = interactions
+        model.searches = searches
+        model._build_content(movies, fingerprint)
+        model._update_ann()
+        model._build_user_items()
+        model._attach_als()
+        model.interaction_watermark = _max_id(interactions)
+        model.search_watermark = _max_id(searches)
+        return model
+
+    def with_updates(self, version, new_interactions, new_searches, movies=None, fingerprint=None,
+                     catalog_version=None):
+        """A new model extending this one with newer events (and a new catalog if movies is given).
+
+        Unchanged parts are shared; anything that changes is rebuilt on the copy.
+        """
+        model = copy.copy(self)
+        model.version = version
+        if catalog_version is not None:
+            model.catalog_version = catalog_version
+        model.built_at = time.time()
+        if movies is not None:
+            model._build_content(movies, fingerprint)
+            model._update_ann(self)
+        if movies is not None or model._als_mtime() != self.als_mtime:
+            model._attach_als()
+        if not new_interactions.empty:
+            model.interactions = pd.concat([self.interactions, new_interactions], ignore_index=True)
+            model.interaction_watermark = _max_id(new_interactions)
+        if movies is not None:
+            # Catalog rows moved, so the user x item columns must be remapped
+            model._build_user_items()
+        elif not new_interactions.empty:
+            model.user_rows = dict(self.user_rows)
+            model.user_ids = list(self.user_ids)
+            model._append_user_items(new_interactions)
+        if not new_searches.empty:
+            model.searches = pd.concat([self.searches, new_searches], ignore_index=True)
+            model.search_watermark = _max_id(new_searches)
+        return model
+
+    def _build_content(self, movies, fingerprint):
+        self.movies = movies
+        self.movies_fingerprint = fingerprint
 
-class Recommender:
-    def __init__(self):
-        self.refresh_data()
-
-    def refresh_data(self):
-        conn = get_db_connection()
-        self.movies = pd.read_sql('SELECT * FROM movies', conn)
-        self.interactions = pd.read_sql('SELECT * FROM interactions', conn)
-        conn.close()
-        
         # Prepare Content-Based Matrix
         # Combine genre and description
         self.movies['content'] = self.movies['genre'].str.replace('|', ' ') + ' ' + self.movies['description']
-        self.tfidf = TfidfVectorizer(stop_words='english')
-        self.tfidf_matrix = self.tfidf.fit_transform(self.movies['content'])
-        self.cosine_sim = linear_kernel(self.tfidf_matrix, self.tfidf_matrix)
+        self.genre_names, self.genre_matrix, self.genre_indptr, self.genre_sequence = \
+            build_genre_index(self.movies['genre'])
+        self.genre_column = {g: i for i, g in enumerate(self.genre_names)}
+        self.genres = set(self.genre_names)
+        self.genre_matcher = GenreMatcher(self.genres)
         
         # Map movie titles to indices
         self.indices = pd.Series(self.movies.index, index=self.movies['id'])
+        if self._load_snapshot():
+            return
+
+        with metrics.stage('tfidf_fit'):
+            self.tfidf = TfidfVectorizer(stop_words='english')
+            self.tfidf_matrix = self.tfidf.fit_transform(self.movies['content'])
+        with metrics.stage('neighbor_index'):
+            self.neighbors = build_neighbor_index(self.tfidf_matrix, top_k=self.neighbor_k)
+        # Dense id -> row lookup (-1 for unknown ids) for vectorized seed handling
+        self.movie_ids = self.movies['id'].to_numpy(dtype=np.int64)
+        self.row_lookup = np.full(int(self.movie_ids.max()) + 1 if len(self.movie_ids) else 0, -1, dtype=np.int64)
+        self.row_lookup[self.movie_ids] = np.arange(len(self.movie_ids))
+        self.snapshot_name = None
+        if self.snapshot_dir and self.save_snapshots and self.movies_fingerprint is not None:
+            self.snapshot_name = snapshot.save(self, self.snapshot_dir)
+
+    def _load_snapshot(self):
+        """Adopt a memory-mapped snapshot of the content model if one matches the catalog."""
+        if not self.snapshot_dir:
+            return False
+        snap = snapshot.load(self.snapshot_dir, self.movies_fingerprint, self.neighbor_k)
+        if snap is None or not np.array_equal(snap['movie_ids'], self.movies['id'].to_numpy()):
+            return False
+        self.tfidf = snap['tfidf']
+        self.tfidf_matrix = snap['tfidf_matrix']
+        self.neighbors = snap['neighbors']
+        self.movie_ids = snap['movie_ids']
+        self.row_lookup = snap['row_lookup']
+        self.snapshot_name = snap['name']
+        return True
+
+    def _update_ann(self, previous=None):
+        """Build the ANN content index, or extend previous's when the catalog only gained movies."""
+        if not self.ann_nprobe:
+            return
+        with metrics.stage('ann_index'):
+            n_old = len(previous.movies) if previous is not None and previous.ann_index is not None else 0
+            appended = (n_old and len(self.movies) >= n_old
+                        and np.array_equal(self.movie_ids[:n_old], previous.movie_ids)
+                        and np.array_equal(self.movies['content'].to_numpy()[:n_old],
+                                           previous.movies['content'].to_numpy())
+                        and previous.ann_index.added + len(self.movies) - n_old <= ANN_REBUILD_FRACTION * n_old)
+            if appended:
+                # New movies are projected with the vectorizer and SVD the index was built from
+                index = previous.ann_index.copy()
+                new_content = self.movies['content'].iloc[n_old:]
+                if len(new_content):
+                    index.add(ann.project(previous.ann_svd, previous.ann_vectorizer.transform(new_content)))
+                self.ann_index, self.ann_svd, self.ann_vectorizer = index, previous.ann_svd, previous.ann_vectorizer
+            else:
+                vectors, self.ann_svd = ann.reduce(self.tfidf_matrix)
+                self.ann_vectorizer = self.tfidf
+                self.ann_index = ann.IVFIndex.build(vectors, nprobe=self.ann_nprobe)
+
+    def _als_mtime(self):
+        try:
+            return os.path.getmtime(self.als_path) if self.als_path else None
+        except OSError:
+            return None
+
+    def _attach_als(self):
+        """Load the ALS factors at als_path, if any, with item factors aligned to the catalog rows."""
+        self.als_mtime = self._als_mtime()
+        factors = als.load(self.als_path) if self.als_mtime is not None else None
+        if factors is None:
+            self.als_factors = self.als_items = self.als_gram = None
+            return
+        self.als_factors = factors
+        self.als_items = factors.aligned_items(self.movie_ids)
+        self.als_gram = self.als_items.T @ self.als_items
+
+    def _build_user_items(self):
+        """(Re)build the CSR user x item interaction-count matrix and its transpose."""
+        self.user_ids = []
+        self.user_rows = {}
+        n_items = len(self.movies)
+        self.user_items = sparse.csr_matrix((0, n_items), dtype=np.float64)
+        self.item_users = sparse.csr_matrix((n_items, 0), dtype=np.float64)
+        self._append_user_items(self.interactions)
+
+    def _append_user_items(self, interactions):
+        """Add interaction rows to the user x item matrices, growing them for new users."""
+        if interactions.empty:
+            return
+        movie_ids = interactions['movie_id'].to_numpy(dtype=np.int64)
+        in_range = (movie_ids >= 0) & (movie_ids < len(self.row_lookup))
+        cols = np.full(len(movie_ids), -1, dtype=np.int64)
+        cols[in_range] = self.row_lookup[movie_ids[in_range]]
+        known = cols >= 0
+
+        user_rows = []
+        for user_id in interactions['user_id'].to_numpy(dtype=np.int64)[known]:
+            row = self.user_rows.get(int(user_id))
+            if row is None:
+                row = self.user_rows[int(user_id)] = len(self.user_ids)
+                self.user_ids.append(int(user_id))
+            user_rows.append(row)
+
+        shape = (len(self.user_ids), len(self.movies))
+        # Duplicate (user, item) pairs are summed, so values are interaction counts
+        delta = sparse.csr_matrix((np.ones(len(user_rows)), (user_rows, cols[known])), shape=shape)
+        self.user_items = _resize(self.user_items, shape) + delta
+        self.item_users = _resize(self.item_users, shape[::-1]) + delta.T.tocsr()
+
+    def rows_for_ids(self, movie_ids):
+        """Catalog rows for movie_ids, skipping ids that are not in the catalog (duplicates are kept)."""
+        ids = np.asarray(movie_ids, dtype=np.int64).ravel()
+        ids = ids[(ids >= 0) & (ids < len(self.row_lookup))]
+        rows = self.row_lookup[ids]
+        return rows[rows >= 0]
 
     def get_content_recommendations(self, movie_ids, top_n=5):
         """Recommend movies similar to the list of movie_ids"""
         if not movie_ids:
             return []
             
-        # Get average similarity scores for the input movies
-        sim_scores = None
-        for movie_id in movie_ids:
-            if movie_id not in self.indices:
-                continue
-            idx = self.indices[movie_id]
-            scores = list(enumerate(self.cosine_sim[idx]))
-            if sim_scores is None:
-                sim_scores = scores
-            else:
-                # Add scores element-wise (simple aggregate)
-                sim_scores = [(i, sim_scores[i][1] + scores[i][1]) for i in range(len(scores))]
-        
-        if not sim_scores:
+        # Sum the seed rows of the neighbor index in one sparse reduction
+        rows = self.rows_for_ids(movie_ids)
+        if not len(rows):
              # Random fallback if IDs invalid
-            return self.movies.sample(top_n).to_dict('records')
+            return movie_records(self.movies.sample(top_n))
+        if self.ann_index is not None:
+            return movie_records(self.movies.iloc[self._ann_content_rows(rows, top_n)])
+        scores = np.asarray(self.neighbors[rows].sum(axis=0)).ravel()
 
-        # Sort
-        sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
-        
         # Exclude input movies
-        sim_scores = [x for x in sim_scores if self.movies.iloc[x[0]]['id'] not in movie_ids]
-        
-        sim_scores = sim_scores[:top_n]
-        movie_indices = [i[0] for i in sim_scores]
-        
-        return self.movies.iloc[movie_indices].to_dict('records')
+        scores[rows] = -np.inf
+        top_n = min(top_n, len(scores) - len(np.unique(rows)))
+        movie_indices = top_rows(scores, top_n)
+
+        return movie_records(self.movies.iloc[movie_indices])
+
+    def _ann_content_rows(self, rows, top_n):
+        """Rows closest to the sum of the seed rows' vectors in the ANN index, seeds excluded."""
+        query = self.ann_index.vectors(rows).sum(axis=0)
+        found, _ = self.ann_index.search(query, top_n, exclude=np.unique(rows))
+        return found
 
     def get_collaborative_recommendations(self, user_id, top_n=5):
         """Simple item-based collaborative filtering based on what others who liked X also liked."""
-        # For this prototype, we'll do a simplified approach since dataset is small.
-        # Find movies user watched/liked
-        user_inter = self.interactions[self.interactions['user_id'] == int(user_id)]
-        watched_ids = user_inter['movie_id'].tolist()
-        
-        if not watched_ids:
+        scores = self.collaborative_scores(user_id)
+        if scores is None:
             return []
+        rec_rows = top_rows(scores, min(top_n, np.count_nonzero(scores > 0)))
+        return movie_records(self.movies.iloc[np.sort(rec_rows)])
+
+    def get_als_recommendations(self, user_id, top_n=5, user_inter=None):
+        """Movies with the highest ALS scores for a user that they have not interacted with."""
+        if self.als_factors is None:
+            return []
+        if user_inter is None:
+            user_inter = self.interactions[self.interactions['user_id'] == int(user_id)]
+        rows = self.als_candidate_rows([int(user_id)], user_inter, top_n)[0]
+        return movie_records(self.movies.iloc[rows])
+
+    def als_user_vectors(self, user_ids, interactions):
+        """ALS factors for users: the trained vector while a user has no newer events, else folded in.
+
+        interactions must hold (at least) every interaction of these users.
+        """
+        factors = self.als_factors
+        vectors = np.zeros((len(user_ids), self.als_items.shape[1]))
+        latest = interactions.groupby('user_id')['id'].max()
+        fold = []
+        for i, u in enumerate(user_ids):
+            row = factors.user_rows.get(u)
+            if row is not None and latest.get(u, 0) <= factors.interaction_watermark:
+                vectors[i] = factors.user_factors[row]
+            else:
+                fold.append(i)
+        if fold:
+            fold_rows = {user_ids[i]: j for j, i in enumerate(fold)}
+            confidence = als.confidence_matrix(interactions, fold_rows, self.row_lookup, len(self.movie_ids),
+                                               factors.alpha)
+            vectors[fold] = als.fold_in(confidence, self.als_items, factors.regularization, self.als_gram)
+        return vectors
+
+    def als_candidate_rows(self, user_ids, interactions, top_n):
+        """Per user, catalog rows of their top_n ALS items, skipping items they interacted with."""
+        vectors = self.als_user_vectors(user_ids, interactions)
+        rows = np.array([self.user_rows.get(u, -1) for u in user_ids], dtype=np.int64)
+        exclude = None
+        if self.user_ids:
+            exclude = sparse.diags((rows >= 0).astype(np.float64)) @ self.user_items[np.maximum(rows, 0)]
+        top, _ = als.top_k(vectors, self.als_items, top_n, exclude)
+        return [r[r >= 0] for r in top]
+
+    def collaborative_scores(self, user_id):
+        """Co-watch counts over the catalog for one user, or None if they have no interactions.
+
+        Each item scores the number of interactions it got from users who share
+        at least one watched item with user_id; items the user already has are 0.
+        """
+        row = self.user_rows.get(int(user_id))
+        if row is None:
+            return None
+        # Find movies user watched/liked
+        watched = self.user_items.indices[self.user_items.indptr[row]:self.user_items.indptr[row + 1]]
+        if not len(watched):
+            return None
 
         # Find other users who watched the same movies
-        similar_users = self.interactions[
-            (self.interactions['movie_id'].isin(watched_ids)) & 
-            (self.interactions['user_id'] != int(user_id))
-        ]['user_id'].unique()
-        
-        # Find movies those users watched that THIS user hasn't
-        recs = self.interactions[
-            (self.interactions['user_id'].isin(similar_users)) & 
-            (~self.interactions['movie_id'].isin(watched_ids))
-        ]['movie_id'].value_counts()
-        
-        rec_ids = recs.head(top_n).index.tolist()
-        return self.movies[self.movies['id'].isin(rec_ids)].to_dict('records')
+        similar = np.unique(self.item_users[watched].indices)
+        indicator = np.zeros(self.user_items.shape[0])
+        indicator[similar] = 1.0
+        indicator[row] = 0.0
+
+        # Count what those users watched that THIS user hasn't
+        scores = self.item_users @ indicator
+        scores[watched] = 0.0
+        return scores
+
+    def collaborative_scores_many(self, user_ids):
+        """Bulk collaborative_scores: a sparse len(user_ids) x N matrix of co-watch counts.
+
+        Unknown users get an empty row. Similar users for the whole batch come
+        from one sparse product with the item x user matrix, and their
+        interaction counts from one more with the user x item matrix.
+        """
+        rows = np.array([self.user_rows.get(int(u), -1) for u in user_ids], dtype=np.int64)
+        known = rows >= 0
+        n_users = self.user_items.shape[0]
+
+        watched = self.user_items[rows[known]]
+        watched.data[:] = 1.0
+        co_watch = (watched @ self.item_users).tocsr()
+        co_watch.data[:] = 1.0
+        # A user is never their own neighbor
+        own = sparse.csr_matrix((np.ones(known.sum()), (np.arange(known.sum()), rows[known])),
+                                shape=(known.sum(), n_users))
+        co_watch = co_watch - co_watch.multiply(own)
+
+        scores = (co_watch @ self.user_items).tocsr()
+        scores = scores - scores.multiply(watched)
+        scores.eliminate_zeros()
+
+        # Scatter back so row i lines up with user_ids[i]
+        placement = sparse.csr_matrix((np.ones(known.sum()), (np.flatnonzero(known), np.arange(known.sum()))),
+                                      shape=(len(rows), known.sum()))
+        return (placement @ scores).tocsr()
 
     def calculate_genre_profile(self, user_id):
-        conn = get_db_connection()
+        """Score a user's genre profile from scratch (the store in self.profiles is the fast path)."""
+        with connections.reader() as conn:
+            interactions = pd.read_sql('SELECT * FROM interactions WHERE user_id = ?', conn, params=(user_id,))
+            searches = pd.read_sql('SELECT * FROM search_history WHERE user_id = ?', conn, params=(user_id,))
         
         # Initialize scores
         scores = {}
         
         # 1. Watch Time & Likes
-        interactions = pd.read_sql('SELECT * FROM interactions WHERE user_id = ?', conn, params=(user_id,))
         for _, row in interactions.iterrows():
             movie = self.movies[self.movies['id'] == row['movie_id']]
             if movie.empty: continue
             
             genres = movie.iloc[0]['genre'].split('|')
-            points = 0
-            
-            if row['interaction_type'] == 'like':
-                points += 10
-            elif row['interaction_type'] == 'watch':
-                # +3 points for every minute watched, up to max 30
-                minutes = row['watch_time'] / 60
-                if minutes > 1:
-                    points += min(int(minutes * 3), 30)
-            
+            points = interaction_points(row['interaction_type'], row['watch_time'])
             for g in genres:
                 scores[g] = scores.get(g, 0) + points
 
         # 2. Search History
-        searches = pd.read_sql('SELECT * FROM search_history WHERE user_id = ?', conn, params=(user_id,))
-        # Simple keyword matching against known genres
-        all_genres = set()
-        for g_str in self.movies['genre'].unique():
-            all_genres.update(g_str.split('|'))
-            
-        for _, row in searches.iterrows():
-            query = row['query'].lower()
-            for genre in all_genres:
-                if genre.lower() in query:
-                    scores[genre] = scores.get(genre, 0) + 5
+        # Keyword matching against known genres, all queries in one pass
+        for genre, hits in self.genre_matcher.count(searches['query']).items():
+            scores[genre] = scores.get(genre, 0) + hits * SEARCH_POINTS
         
-        conn.close()
         return scores
 
     def get_hybrid_recommendations(self, user_id, top_n=10):
-        self.refresh_data() 
-        
         # 1. Get Base Candidates (Content + Collaborative)
         # Reuse existing logic to get a pool of candidates
-        user_inter = self.interactions[
-             (self.interactions['user_id'] == int(user_id))
-        ]
+        with metrics.stage('user_history'):
+            user_inter = self.interactions[
+                 (self.interactions['user_id'] == int(user_id))
+            ]
         
         if user_inter.empty:
-            candidates = self.movies.sort_values('rating', ascending=False).head(20).to_dict('records')
+            candidates = self._popular_candidates()
         else:
-            strong_interest = user_inter[
-                 (user_inter['interaction_type'] == 'like') | 
-                 ((user_inter['interaction_type'] == 'watch') & (user_inter['watch_time'] > 300))
-            ]['movie_id'].tolist()
-            
-            watched_ids = user_inter['movie_id'].tolist()
+            strong_interest, watched_ids = _interest_lists(user_inter)
             
             content_recs = []
             if strong_interest:
-                content_recs = self.get_content_recommendations(strong_interest, top_n=15) # Get more for re-ranking
+                with metrics.stage('content_candidates'):
+                    content_recs = self.get_content_recommendations(strong_interest, top_n=15) # Get more for re-ranking
             
-            collab_recs = self.get_collaborative_recommendations(user_id, top_n=15)
-            
-            # Combine
-            combined = {m['id']: m for m in content_recs + collab_recs}
-            candidates = list(combined.values())
-            
-            # Fill if low
-            if len(candidates) < 10:
-                 more = self.movies[~self.movies['id'].isin(watched_ids + [m['id'] for m in candidates])]
-                 candidates.extend(more.sort_values('rating', ascending=False).head(20 - len(candidates)).to_dict('records'))
+            with metrics.stage('collaborative_candidates'):
+                collab_recs = self.get_collaborative_recommendations(user_id, top_n=15)
+            als_recs = []
+            if self.als_factors is not None:
+                with metrics.stage('als_candidates'):
+                    als_recs = self.get_als_recommendations(user_id, top_n=15, user_inter=user_inter)
+            with metrics.stage('merge'):
+                candidates = self._merge_candidates(content_recs, collab_recs, watched_ids, als_recs)
+
+        return self._rerank(user_id, candidates, top_n)
+
+    def recommend_many(self, user_ids, top_n=10, chunk_size=256):
+        """Hybrid recommendations for many users, yielded as (user_id, recs) in input order.
+
+        Content and collaborative candidates for each chunk of users come
+        from sparse matrix products rather than per-user calls, then go
+        through the same merge and re-rank as get_hybrid_recommendations.
+        """
+        records = movie_records(self.movies)
+        n_items = len(records)
+        popular = None
+
+        for start in range(0, len(user_ids), chunk_size):
+            chunk = [int(u) for u in user_ids[start:start + chunk_size]]
+            chunk_inter = self.interactions[self.interactions['user_id'].isin(chunk)]
+            by_user = {u: frame for u, frame in chunk_inter.groupby('user_id')}
+
+            # Seed counts per user (strong-interest rows) x neighbor index in one product
+            interests = {}
+            seed_users, seed_rows = [], []
+            for i, u in enumerate(chunk):
+                if u not in by_user:
+                    continue
+                strong_interest, watched_ids = _interest_lists(by_user[u])
+                rows = self.rows_for_ids(strong_interest)
+                interests[u] = (strong_interest, watched_ids, rows)
+                seed_users.extend([i] * len(rows))
+                seed_rows.extend(rows)
+            seeds = sparse.csr_matrix((np.ones(len(seed_rows)), (seed_users, seed_rows)),
+                                      shape=(len(chunk), n_items))
+            with metrics.stage('batch_candidates'):
+                content = (seeds @ self.neighbors).tocsr()
+                collab = self.collaborative_scores_many(chunk)
+                als_rows = {}
+                active = [u for u in chunk if u in interests]
+                if self.als_factors is not None and active:
+                    als_rows = dict(zip(active, self.als_candidate_rows(active, chunk_inter, 15)))
+
+            for i, u in enumerate(chunk):
+                if u not in interests:
+                    if popular is None:
+                        popular = self._popular_candidates()
+                    yield u, self._rerank(u, [dict(m) for m in popular], top_n)
+                    continue
+
+                strong_interest, watched_ids, rows = interests[u]
+                content_recs = []
+                if strong_interest and not len(rows):
+                    content_recs = movie_records(self.movies.sample(15))
+                elif strong_interest and self.ann_index is not None:
+                    content_recs = [dict(records[r]) for r in self._ann_content_rows(rows, 15)]
+                elif strong_interest:
+                    scores = content[i].toarray().ravel()
+                    scores[rows] = -np.inf
+                    top = top_rows(scores, min(15, n_items - len(np.unique(rows))))
+                    content_recs = [dict(records[r]) for r in top]
+
+                scores = collab[i].toarray().ravel()
+                top = np.sort(top_rows(scores, min(15, np.count_nonzero(scores > 0))))
+                collab_recs = [dict(records[r]) for r in top]
+                als_recs = [dict(records[r]) for r in als_rows.get(u, ())]
+
+                candidates = self._merge_candidates(content_recs, collab_recs, watched_ids, als_recs)
+                yield u, self._rerank(u, candidates, top_n)
+
+    def _popular_candidates(self):
+        return movie_records(self.movies.sort_values('rating', ascending=False).head(20))
 
-        # 2. Calculate User Genre Profile
-        profile = self.calculate_genre_profile(user_id)
+    def _merge_candidates(self, content_recs, collab_recs, watched_ids, als_recs=()):
+        # Combine
+        combined = {m['id']: m for m in content_recs + collab_recs + list(als_recs)}
+        candidates = list(combined.values())
+        
+        # Fill if low
+        if len(candidates) < 10:
+             more = self.movies[~self.movies['id'].isin(watched_ids + [m['id'] for m in candidates])]
+             candidates.extend(movie_records(more.sort_values('rating', ascending=False).head(20 - len(candidates))))
+        return candidates
+
+    def _user_profile(self, user_id):
+        # User genre profile (maintained at write time)
+        if self.profiles.loaded:
+            return self.profiles.get(user_id)
+        return self.calculate_genre_profile(user_id)
+
+    def genre_match(self, profile, rows=None):
+        """Match percent and top genre column for catalog rows (all rows by default) under a genre profile.
+
+        The match score is one product of the movie x genre matrix with the
+        profile vector; the top genre is the first of a movie's genres, in
+        listed order, with the highest profile score.
+        """
+        rows = np.arange(len(self.movies)) if rows is None else np.asarray(rows, dtype=np.int64)
+        weights = np.array([profile.get(g, 0) for g in self.genre_names], dtype=np.float64)
+        match = self.genre_matrix[rows] @ weights
+        max_score = max(profile.values())
+        # Normalize to 0-100 relative to the max profile score, boost slightly
+        # by rating, cap at 99 (an all-zero profile matches nothing)
+        percent = np.zeros(len(rows)) if max_score == 0 else np.minimum(np.trunc(match / max_score * 100), 100)
+        # An unrated movie gets no rating boost
+        rating = np.nan_to_num(self.movies['rating'].to_numpy(dtype=np.float64)[rows])
+        percent = np.minimum(percent + np.trunc(rating), 99)
+
+        starts = self.genre_indptr[rows]
+        lengths = self.genre_indptr[rows + 1] - starts
+        owner = np.repeat(np.arange(len(rows)), lengths)
+        offsets = np.arange(len(owner)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        sequence = self.genre_sequence[np.repeat(starts, lengths) + offsets]
+        values = weights[sequence]
+        row_max = np.full(len(rows), -np.inf)
+        np.maximum.at(row_max, owner, values)
+        at_max = np.flatnonzero(values == row_max[owner])
+        _, first = np.unique(owner[at_max], return_index=True)
+        return percent.astype(np.int64), sequence[at_max[first]], row_max
+
+    def _rerank(self, user_id, candidates, top_n):
+        with metrics.stage('profile'):
+            profile = self._user_profile(user_id)
         if not profile:
              return candidates[:top_n] # No profile, return standard
-             
-        max_score = max(profile.values()) if profile.values() else 1
-
-        # 3. Re-Rank Candidates
-        scored_candidates = []
-        for movie in candidates:
-            movie_genres = movie['genre'].split('|')
-            match_score = 0
-            # Sum scores of matching genres
-            for g in movie_genres:
-                match_score += profile.get(g, 0)
-            
-            # Normalize to 0-100 scale relative to max profile score
-            # A perfect match would contain the user's favorite genres
-            final_percent = min(int((match_score / max_score) * 100), 100)
-            
-            # Heuristic: Boost by rating slightly
-            final_percent += int(movie['rating'])
-            final_percent = min(final_percent, 99)
-            
-            movie['match_score'] = final_percent
-            
-            # Determine "Reason"
-            top_genre = max(movie_genres, key=lambda g: profile.get(g, 0))
-            if profile.get(top_genre, 0) > 0:
-                movie['match_reason'] = f"Because you watch {top_genre}"
-            else:
-                movie['match_reason'] = "Popular on Netflix"
-                
-            scored_candidates.append(movie)
-            
-        # Sort by Match Score
-        scored_candidates.sort(key=lambda x: x.get('match_score', 0), reverse=True)
-        
-        return scored_candidates[:top_n]
+
+        # Re-Rank Candidates
+        with metrics.stage('rerank'):
+            rows = self.row_lookup[[m['id'] for m in candidates]]
+            percent, top_genres, top_scores = self.genre_match(profile, rows)
+            for movie, score, genre, genre_score in zip(candidates, percent, top_genres, top_scores):
+                movie['match_score'] = int(score)
+                if genre_score > 0:
+                    movie['match_reason'] = f"Because you watch {self.genre_names[genre]}"
+                else:
+                    movie['match_reason'] = "Popular on Netflix"
+
+            # Sort by Match Score (stable, like list.sort)
+            order = np.argsort(-percent, kind='stable')[:top_n]
+            return [candidates[i] for i in order]
+
+class Recommender:
+    """Serves recommendations from the active RecommenderModel and keeps it up to date.
+
+    New models are always built completely on the side and then published
+    with a single reference swap, so requests never see half-built state.
+    By default a request triggers an (incremental) rebuild unless another
+    one is already running; with start_background_rebuild() rebuilds happen
+    only on the ModelRebuilder thread and requests never wait on them.
+    Attributes of the active model (movies, neighbors, ...) and its methods
+    can be read directly off the Recommender.
+    """
+
+    def __init__(self, incremental=True, neighbor_k=NEIGHBOR_K, load=True, snapshot_dir=None,
+                 save_snapshots=False, als_path=None, ann_nprobe=None):
+        # When incremental, request-time refreshes only pull rows past the
+        # watermarks and refit the content model when `movies` changes.
+        self.incremental = incremental
+        self.neighbor_k = neighbor_k
+        # Content models are loaded from (and optionally saved to) snapshot_dir
+        # when a snapshot matches the current movies table
+        self.snapshot_dir = snapshot_dir
+        self.save_snapshots = save_snapshots
+        # ALS factors file (written by `python als.py train`), reloaded when it changes
+        self.als_path = als_path
+        # Lists probed per content query in the ANN index (None: exact scoring)
+        self.ann_nprobe = ann_nprobe
+        self.profiles = GenreProfileStore()
+        self.model = None
+        self.last_refresh = None
+        self.rebuilder = None
+        self._next_version = 1
+        self._refresh_lock = threading.Lock()
+        if load:
+            self.refresh_data()
+
+    def __getattr__(self, name):
+        # Read-through to the active model. Each access may see a newer model,
+        # so code needing several consistent reads should hold `model` itself.
+        model = self.__dict__.get('model')
+        if model is None:
+            raise AttributeError(name)
+        return getattr(model, name)
+
+    @property
+    def model_version(self):
+        model = self.model
+        return model.version if model is not None else 0
+
+    @classmethod
+    def from_frames(cls, movies, interactions=None, searches=None, **kwargs):
+        """Build a recommender from in-memory frames instead of the database (benchmarks, offline jobs)."""
+        rec = cls(load=False, **kwargs)
+        rec.model = RecommenderModel.build(movies, interactions, searches, None, rec._take_version(),
+                                           **rec._model_options())
+        return rec
+
+    def _model_options(self):
+        return {
+            'neighbor_k': self.neighbor_k,
+            'profiles': self.profiles,
+            'snapshot_dir': self.snapshot_dir,
+            'save_snapshots': self.save_snapshots,
+            'als_path': self.als_path,
+            'ann_nprobe': self.ann_nprobe,
+        }
+
+    def _take_version(self):
+        version = self._next_version
+        self._next_version += 1
+        return version
+
+    def refresh_data(self, incremental=False):
+        """Build the next model version from the database, swap it in and report what changed."""
+        with self._refresh_lock:
+            return self._refresh(incremental)
+
+    def _refresh(self, incremental):
+        start = time.perf_counter()
+        if not incremental or self.model is None:
+            with metrics.stage('refresh_full'):
+                report = self._full_refresh()
+        else:
+            with metrics.stage('refresh_incremental'):
+                report = self._incremental_refresh()
+        report['version'] = self.model.version
+        report['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        self.last_refresh = report
+        return report
+
+    def _full_refresh(self):
+        with connections.reader() as conn:
+            # Read before the rows, so a concurrent edit at worst causes one extra rebuild
+            version = catalog_version(conn)
+            movies = pd.read_sql('SELECT * FROM movies', conn)
+            interactions = pd.read_sql('SELECT * FROM interactions', conn)
+            searches = pd.read_sql('SELECT * FROM search_history', conn)
+        # Under the write lock so no committed event is both reloaded and applied again
+        with connections.write_locked() as conn:
+            self.profiles.load(conn)
+
+        model = RecommenderModel.build(movies, interactions, searches, movies_fingerprint(movies),
+                                       self._take_version(), catalog_version=version, **self._model_options())
+        self.model = model
+        return {
+            'mode': 'full',
+            'movies_rebuilt': True,
+            'movies': len(model.movies),
+            'interactions_added': len(model.interactions),
+            'searches_added': len(model.searches),
+            'interaction_watermark': model.interaction_watermark,
+            'search_watermark': model.search_watermark,
+        }
+
+    def _incremental_refresh(self):
+        current = self.model
+        with connections.reader() as conn:
+            version = catalog_version(conn)
+            movies = pd.read_sql('SELECT * FROM movies', conn) if version != current.catalog_version else None
+            new_interactions = pd.read_sql('SELECT * FROM interactions WHERE id > ? ORDER BY id', conn,
+                                           params=(current.interaction_watermark,))
+            new_searches = pd.read_sql('SELECT * FROM search_history WHERE id > ? ORDER BY id', conn,
+                                       params=(current.search_watermark,))
+
+        # Edits that leave the rows as they were (e.g. an update to the same value) keep the content model
+        fingerprint = movies_fingerprint(movies) if movies is not None else current.movies_fingerprint
+        movies_changed = fingerprint != current.movies_fingerprint
+        model = current
+        als_changed = current._als_mtime() != current.als_mtime
+        if version != current.catalog_version or als_changed or not new_interactions.empty or \
+                not new_searches.empty:
+            model = current.with_updates(self._take_version(), new_interactions, new_searches,
+                                         movies=movies if movies_changed else None, fingerprint=fingerprint,
+                                         catalog_version=version)
+            self.model = model
+        return {
+            'mode': 'incremental',
+            'movies_rebuilt': movies_changed,
+            'als_reloaded': als_changed,
+            'movies': len(model.movies),
+            'interactions_added': len(new_interactions),
+            'searches_added': len(new_searches),
+            'interaction_watermark': model.interaction_watermark,
+            'search_watermark': model.search_watermark,
+        }
+
+    def pending_changes(self):
+        """(movies or ALS factors changed?, new interactions, new searches) since the active model was built."""
+        model = self.model
+        with connections.reader() as conn:
+            movies_changed = catalog_version(conn) != model.catalog_version or \
+                model._als_mtime() != model.als_mtime
+            new_interactions = conn.execute('SELECT COUNT(*) FROM interactions WHERE id > ?',
+                                            (model.interaction_watermark,)).fetchone()[0]
+            new_searches = conn.execute('SELECT COUNT(*) FROM search_history WHERE id > ?',
+                                        (model.search_watermark,)).fetchone()[0]
+        return movies_changed, new_interactions, new_searches
+
+    def _request_model(self):
+        """The model a request should use, refreshing first when no background rebuilder runs.
+
+        If another thread is already rebuilding, the request does not wait:
+        it serves from the currently active model.
+        """
+        if self.rebuilder is None and self._refresh_lock.acquire(blocking=False):
+            try:
+                self._refresh(self.incremental)
+            finally:
+                self._refresh_lock.release()
+        return self.model
+
+    def get_hybrid_recommendations(self, user_id, top_n=10):
+        return self._request_model().get_hybrid_recommendations(user_id, top_n)
+
+    def recommend_many(self, user_ids, top_n=10, chunk_size=256):
+        """Hybrid recommendations for many users from one model version; see RecommenderModel.recommend_many."""
+        return self._request_model().recommend_many(user_ids, top_n, chunk_size)
+
+    def start_background_rebuild(self, interval=30.0, min_events=1, max_interval=None):
+        """Move model rebuilds off the request path onto a ModelRebuilder thread."""
+        if self.rebuilder is None:
+            self.rebuilder = ModelRebuilder(self, interval, min_events, max_interval)
+            self.rebuilder.start()
+        return self.rebuilder
+
+    def stop_background_rebuild(self):
+        rebuilder, self.rebuilder = self.rebuilder, None
+        if rebuilder is not None:
+            rebuilder.stop()
+            rebuilder.join()
+
+    def record_interaction(self, conn, user_id, movie_id, interaction_type, watch_time=0):
+        """Write-time hook for /api/interact; runs on the request's connection before it commits.
+
+        Returns the in-memory profile update, to be run after the commit.
+        """
+        row = conn.execute('SELECT genre FROM movies WHERE id = ?', (movie_id,)).fetchone()
+        if row is None:
+            return lambda: None
+        return self.profiles.record_interaction(conn, user_id, row[0].split('|'), interaction_type, watch_time)
+
+    def record_search(self, conn, user_id, query):
+        """Write-time hook for /api/track/search; like record_interaction, returns the post-commit update."""
+        return self.profiles.record_search(conn, user_id, query, self.model.genre_matcher)
+
+class ModelRebuilder(threading.Thread):
+    """Background thread that builds and swaps in new model versions.
+
+    Every `interval` seconds it checks for changes; it rebuilds when the
+    catalog changed or at least `min_events` new interactions/searches
+    arrived, and also when `max_interval` seconds have passed since the last
+    rebuild and anything at all is pending.
+    """
+
+    def __init__(self, recommender, interval=30.0, min_events=1, max_interval=None):
+        super().__init__(name='model-rebuilder', daemon=True)
+        self.recommender = recommender
+        self.interval = interval
+        self.min_events = min_events
+        self.max_interval = max_interval
+        self.rebuilds = 0
+        self.last_error = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        last_rebuild = time.monotonic()
+        while not self._stop_event.wait(self.interval):
+            try:
+                movies_changed, new_interactions, new_searches = self.recommender.pending_changes()
+                pending = new_interactions + new_searches
+                overdue = self.max_interval is not None and time.monotonic() - last_rebuild >= self.max_interval
+                if movies_changed or pending >= self.min_events or (overdue and pending):
+                    self.recommender.refresh_data(incremental=True)
+                    self.rebuilds += 1
+                    last_rebuild = time.monotonic()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Model rebuild failed: {e}")
+
+    def stop(self):
+        self._stop_event.set()
@@ -0,0 +1,150 @@
+"""Versioned on-disk snapshots of the fitted content model.
+
+A snapshot holds the TF-IDF vocabulary and idf weights, the sparse TF-IDF
+matrix, the top-K neighbor index and the id <-> row maps, written as .npy
+files so they can be loaded back with mmap_mode instead of refitting.
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+FORMAT_VERSION = 2
+# Absolute, so the app and the offline CLIs agree whatever the working
+# directory; overridable with NETFLIX_REC_SNAPSHOTS
+DEFAULT_DIR = os.path.abspath(os.environ.get(
+    'NETFLIX_REC_SNAPSHOTS', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_snapshots')))
+CURRENT_FILE = 'CURRENT'
+KEEP_SNAPSHOTS = 3
+
+def snapshot_name(fingerprint, neighbor_k):
+    # fingerprint is the catalog content hash (recommender.movies_fingerprint)
+    return f'v{FORMAT_VERSION}-{fingerprint[:16]}-k{neighbor_k}'
+
+def _save_csr(directory, prefix, matrix):
+    np.save(os.path.join(directory, f'{prefix}_data.npy'), matrix.data)
+    np.save(os.path.join(directory, f'{prefix}_indices.npy'), matrix.indices)
+    np.save(os.path.join(directory, f'{prefix}_indptr.npy'), matrix.indptr)
+
+def _load_csr(directory, prefix, shape, mmap_mode):
+    parts = [np.load(os.path.join(directory, f'{prefix}_{part}.npy'), mmap_mode=mmap_mode)
+             for part in ('data', 'indices', 'indptr')]
+    return sparse.csr_matrix(tuple(parts), shape=tuple(shape), copy=False)
+
+def save(model, root):
+    """Write a RecommenderModel's content index under root and make it CURRENT; returns its name."""
+    if model.movies_fingerprint is None:
+        raise ValueError('Only models loaded from the database can be snapshotted')
+    name = snapshot_name(model.movies_fingerprint, model.neighbor_k)
+    os.makedirs(root, exist_ok=True)
+    staging = os.path.join(root, f'.{name}.{os.getpid()}.tmp')
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    vectorizer = model.tfidf
+    with open(os.path.join(staging, 'vocabulary.json'), 'w') as f:
+        json.dump({term: int(i) for term, i in vectorizer.vocabulary_.items()}, f)
+    np.save(os.path.join(staging, 'idf.npy'), vectorizer.idf_)
+    _save_csr(staging, 'tfidf', sparse.csr_matrix(model.tfidf_matrix))
+    _save_csr(staging, 'neighbors', model.neighbors)
+    np.save(os.path.join(staging, 'movie_ids.npy'), model.movie_ids)
+    np.save(os.path.join(staging, 'row_lookup.npy'), model.row_lookup)
+    meta = {
+        'format': FORMAT_VERSION,
+        'name': name,
+        'created_at': time.time(),
+        'fingerprint': model.movies_fingerprint,
+        'neighbor_k': model.neighbor_k,
+        'tfidf_shape': list(model.tfidf_matrix.shape),
+        'neighbors_shape': list(model.neighbors.shape),
+    }
+    with open(os.path.join(staging, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    # Publish atomically: rename the finished directory, then swap the pointer
+    final = os.path.join(root, name)
+    shutil.rmtree(final, ignore_errors=True)
+    os.replace(staging, final)
+    pointer = os.path.join(root, f'.{CURRENT_FILE}.{os.getpid()}.tmp')
+    with open(pointer, 'w') as f:
+        f.write(name)
+    os.replace(pointer, os.path.join(root, CURRENT_FILE))
+    _prune(root, keep=name)
+    return name
+
+def _prune(root, keep):
+    snapshots = sorted(
+        (d for d in os.listdir(root) if d.startswith('v') and os.path.isdir(os.path.join(root, d)) and d != keep),
+        key=lambda d: os.path.getmtime(os.path.join(root, d)), reverse=True)
+    for d in snapshots[KEEP_SNAPSHOTS - 1:]:
+        shutil.rmtree(os.path.join(root, d), ignore_errors=True)
+
+def current(root):
+    """Name of the CURRENT snapshot under root, or None."""
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def load(root, fingerprint, neighbor_k, mmap_mode='r'):
+    """Load the snapshot matching fingerprint and neighbor_k, or None if there is none.
+
+    Arrays are memory-mapped (read-only) so load time does not grow with the catalog.
+    """
+    if fingerprint is None:
+        return None
+    directory = os.path.join(root, snapshot_name(fingerprint, neighbor_k))
+    try:
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    if meta['format'] != FORMAT_VERSION or meta['fingerprint'] != fingerprint:
+        return None
+
+    with open(os.path.join(directory, 'vocabulary.json')) as f:
+        vocabulary = json.load(f)
+    vectorizer = TfidfVectorizer(stop_words='english')
+    vectorizer.vocabulary_ = vocabulary
+    vectorizer.idf_ = np.load(os.path.join(directory, 'idf.npy'))
+    return {
+        'name': meta['name'],
+        'tfidf': vectorizer,
+        'tfidf_matrix': _load_csr(directory, 'tfidf', meta['tfidf_shape'], mmap_mode),
+        'neighbors': _load_csr(directory, 'neighbors', meta['neighbors_shape'], mmap_mode),
+        'movie_ids': np.load(os.path.join(directory, 'movie_ids.npy'), mmap_mode=mmap_mode),
+        'row_lookup': np.load(os.path.join(directory, 'row_lookup.npy'), mmap_mode=mmap_mode),
+    }
+
+if __name__ == '__main__':
+    from database import get_db_connection, migrate
+    from recommender import NEIGHBOR_K, Recommender
+
+    parser = argparse.ArgumentParser(description='Build or inspect content model snapshots.')
+    parser.add_argument('command', choices=['build', 'info'])
+    parser.add_argument('--dir', default=DEFAULT_DIR)
+    parser.add_argument('--neighbors', type=int, default=NEIGHBOR_K)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        # The refresh path reads tables added by migrations (e.g. catalog_version)
+        conn = get_db_connection()
+        migrate(conn)
+        conn.close()
+        rec = Recommender(neighbor_k=args.neighbors)
+        name = save(rec.model, args.dir)
+        print(f"Built snapshot {name} for {len(rec.movies)} movies in {time.perf_counter() - start:.1f}s")
+    else:
+        name = current(args.dir)
+        if name is None:
+            print(f"No snapshot in {args.dir}")
+        else:
+            with open(os.path.join(args.dir, name, 'meta.json')) as f:
+                print(json.dumps(json.load(f), indent=2))
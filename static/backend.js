@@ -31,11 +31,28 @@ async function fetchData() {
         // Render Charts
         renderGenreChart(data.top_genres);
 
+        // Latency histograms (recommender stages first, then routes)
+        const metricsRes = await fetch('/api/admin/metrics?format=json');
+        const metrics = await metricsRes.json();
+        const isStage = row => row.name === 'recommender_stage_seconds';
+        const latency = metrics.histograms.filter(isStage).concat(metrics.histograms.filter(row => !isStage(row)));
+        renderTable('latency-table', latency, row => `
+            <td>${row.labels.stage || `${row.labels.method} ${row.labels.route}`}</td>
+            <td>${row.count}</td>
+            <td>${formatMs(row.p50_ms)}</td>
+            <td>${formatMs(row.p95_ms)}</td>
+            <td>${formatMs(row.p99_ms)}</td>
+        `);
+
     } catch (err) {
         console.error("Failed to fetch dashboard data", err);
     }
 }
 
+function formatMs(value) {
+    return value === null ? '-' : value.toFixed(2);
+}
+
 function renderTable(elementId, data, rowTemplate) {
     const tbody = document.getElementById(elementId);
     tbody.innerHTML = '';
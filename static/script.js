@@ -37,13 +37,13 @@ document.addEventListener('DOMContentLoaded', () => {
 
     searchBtn.addEventListener('click', () => {
         const query = searchInput.value;
-        if (query) trackSearch(query);
+        if (query) runSearch(query);
     });
 
     searchInput.addEventListener('keypress', (e) => {
         if (e.key === 'Enter') {
             const query = searchInput.value;
-            if (query) trackSearch(query);
+            if (query) runSearch(query);
         }
     });
 
@@ -171,6 +171,29 @@ document.addEventListener('DOMContentLoaded', () => {
         };
     }
 
+    async function runSearch(query) {
+        // Results reuse the genre view
+        dashView.style.display = "none";
+        genreView.style.display = "block";
+
+        genreTitle.textContent = `Results for "${query}"`;
+        genreList.innerHTML = '<p class="loading-msg">Searching...</p>';
+        trackSearch(query);
+
+        try {
+            const res = await fetch(`${apiBase}/search?q=${encodeURIComponent(query)}&per_page=50`);
+            const movies = await res.json();
+            if (movies.length === 0) {
+                genreList.innerHTML = '<p>No movies match your search.</p>';
+                return;
+            }
+            renderList(genreList, movies);
+        } catch (e) {
+            console.error("Search error", e);
+            genreList.innerHTML = '<p class="error-msg">Search failed.</p>';
+        }
+    }
+
     async function loadGenre(genre) {
         // Switch Views
         dashView.style.display = "none";
@@ -309,7 +332,6 @@ document.addEventListener('DOMContentLoaded', () => {
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({ user_id: currentUser, query: query })
             });
-            alert(`Search tracked: "${query}"`);
         } catch (e) { console.error(e); }
     }
 
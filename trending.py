@@ -0,0 +1,178 @@
+import heapq
+import sys
+import threading
+import time
+from collections import Counter
+
+from database import get_db_connection
+
+# Interactions are counted per movie in hourly buckets. A window covers the
+# current bucket plus the previous span - 1 ones; 'all' is all-time.
+BUCKET_SECONDS = 3600
+WINDOWS = {'1h': 1, '24h': 24, '7d': 24 * 7, 'all': None}
+DEFAULT_WINDOW = '7d'
+# Buckets older than the longest window are folded into this one by compact()
+ARCHIVE_BUCKET = 0
+
+def bucket_of(timestamp):
+    return int(timestamp // BUCKET_SECONDS)
+
+def _retention():
+    return max(span for span in WINDOWS.values() if span is not None)
+
+class TrendingStore:
+    """Per-movie interaction counts over sliding windows, kept in `movie_trending_buckets`.
+
+    The write path calls record_interaction with the request's connection so
+    the bucket row commits together with the event; it returns the in-memory
+    update, to be run once that transaction has committed (updates recorded
+    before a load() are skipped, as in profiles.GenreProfileStore). In memory, every window
+    keeps a running Counter: new events are added to all of them and a
+    bucket's counts are subtracted from a window once it slides out, so top()
+    only has to pick the K largest entries of one Counter.
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self._windows = {name: Counter() for name in WINDOWS}
+        self._window_start = {}
+        self._genres = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.loaded = False
+
+    def load(self, conn, now=None):
+        """Replace the in-memory counters with the stored buckets (left unloaded if the table is missing)."""
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='movie_trending_buckets'").fetchone():
+            return
+        current = bucket_of(time.time() if now is None else now)
+        oldest = current - _retention() + 1
+        buckets = {}
+        for movie_id, bucket, count in conn.execute(
+                'SELECT movie_id, bucket, count FROM movie_trending_buckets WHERE bucket >= ?', (oldest,)):
+            buckets.setdefault(bucket, Counter())[movie_id] = count
+        windows = {}
+        window_start = {}
+        for name, span in WINDOWS.items():
+            if span is None:
+                windows[name] = Counter(dict(conn.execute(
+                    'SELECT movie_id, SUM(count) FROM movie_trending_buckets GROUP BY movie_id').fetchall()))
+                continue
+            window_start[name] = current - span + 1
+            windows[name] = Counter()
+            for bucket, counts in buckets.items():
+                if bucket >= window_start[name]:
+                    windows[name].update(counts)
+        genres = {movie_id: _genre_set(genre) for movie_id, genre in conn.execute('SELECT id, genre FROM movies')}
+        with self._lock:
+            self._buckets = buckets
+            self._windows = windows
+            self._window_start = window_start
+            self._genres = genres
+            self._generation += 1
+        self.loaded = True
+
+    def record_interaction(self, conn, movie_id, timestamp=None):
+        bucket = bucket_of(time.time() if timestamp is None else timestamp)
+        movie_id = int(movie_id)
+        conn.execute('''
+            INSERT INTO movie_trending_buckets (movie_id, bucket, count) VALUES (?, ?, 1)
+            ON CONFLICT (movie_id, bucket) DO UPDATE SET count = count + 1
+        ''', (movie_id, bucket))
+        genres = None
+        if movie_id not in self._genres:
+            row = conn.execute('SELECT genre FROM movies WHERE id = ?', (movie_id,)).fetchone()
+            genres = _genre_set(row[0]) if row else set()
+        generation = self._generation
+
+        def apply():
+            with self._lock:
+                if generation != self._generation:
+                    return
+                if genres is not None:
+                    self._genres[movie_id] = genres
+                self._advance(bucket)
+                self._buckets.setdefault(bucket, Counter())[movie_id] += 1
+                for name, counts in self._windows.items():
+                    if name not in self._window_start or bucket >= self._window_start[name]:
+                        counts[movie_id] += 1
+        return apply
+
+    def _advance(self, current):
+        """Slide every window forward to end at bucket `current` (caller holds the lock)."""
+        for name, span in WINDOWS.items():
+            if span is None:
+                continue
+            start = current - span + 1
+            previous = self._window_start.get(name, start)
+            if start <= previous:
+                self._window_start.setdefault(name, start)
+                continue
+            counts = self._windows[name]
+            for bucket in [b for b in self._buckets if previous <= b < start]:
+                counts.subtract(self._buckets[bucket])
+            # Drop movies whose count fell to zero so top() never sees them
+            for movie_id in [m for m, c in counts.items() if c <= 0]:
+                del counts[movie_id]
+            self._window_start[name] = start
+        oldest = current - _retention() + 1
+        for bucket in [b for b in self._buckets if b < oldest]:
+            del self._buckets[bucket]
+
+    def top(self, window=DEFAULT_WINDOW, k=10, genre=None, now=None):
+        """The k most interacted-with movies in window as (movie_id, count), optionally limited to one genre."""
+        if window not in WINDOWS:
+            raise ValueError(f"Unknown window {window!r}; expected one of {', '.join(WINDOWS)}")
+        genre = genre.lower() if genre else None
+        with self._lock:
+            self._advance(bucket_of(time.time() if now is None else now))
+            items = self._windows[window].items()
+            if genre is not None:
+                items = [(m, c) for m, c in items if genre in self._genres.get(m, ())]
+            # Ties go to the lower movie id so results are stable
+            return heapq.nlargest(k, items, key=lambda item: (item[1], -item[0]))
+
+def _genre_set(genre):
+    return {g.lower() for g in genre.split('|')}
+
+def backfill(conn):
+    """Rebuild the stored buckets from the full interaction history. Caller commits."""
+    conn.execute('DELETE FROM movie_trending_buckets')
+    conn.execute(f'''
+        INSERT INTO movie_trending_buckets (movie_id, bucket, count)
+        SELECT movie_id, CAST(strftime('%s', timestamp) AS INTEGER) / {BUCKET_SECONDS}, COUNT(*)
+        FROM interactions
+        WHERE movie_id IS NOT NULL
+        GROUP BY 1, 2
+    ''')
+
+def compact(conn, now=None):
+    """Fold buckets older than the longest window into ARCHIVE_BUCKET. Caller commits.
+
+    Keeps the table at roughly movies x retention rows while all-time
+    totals stay exact.
+    """
+    oldest = bucket_of(time.time() if now is None else now) - _retention() + 1
+    conn.execute('''
+        INSERT INTO movie_trending_buckets (movie_id, bucket, count)
+        SELECT movie_id, ?, SUM(count) FROM movie_trending_buckets
+        WHERE bucket > ? AND bucket < ?
+        GROUP BY movie_id
+        ON CONFLICT (movie_id, bucket) DO UPDATE SET count = count + excluded.count
+    ''', (ARCHIVE_BUCKET, ARCHIVE_BUCKET, oldest))
+    return conn.execute('DELETE FROM movie_trending_buckets WHERE bucket > ? AND bucket < ?',
+                        (ARCHIVE_BUCKET, oldest)).rowcount
+
+if __name__ == '__main__':
+    # python trending.py backfill|compact
+    if len(sys.argv) != 2 or sys.argv[1] not in ('backfill', 'compact'):
+        print('usage: python trending.py backfill|compact')
+        sys.exit(1)
+    conn = get_db_connection()
+    if sys.argv[1] == 'backfill':
+        backfill(conn)
+        print("Rebuilt trending buckets from interaction history.")
+    else:
+        print(f"Compacted {compact(conn)} trending buckets.")
+    conn.commit()
+    conn.close()
@@ -0,0 +1,47 @@
+import json
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from recommender import Recommender
+
+def test_unrated_candidate():
+    print("Testing Unrated Candidates...")
+
+    # Three Sci-Fi movies, one without a rating. The user liked a Drama and
+    # has a profile of Drama 10, Sci-Fi 5, so Sci-Fi matches 50%.
+    movies = pd.DataFrame({
+        'id': [1, 2, 3, 4, 5],
+        'title': ['Liked', 'Rated A', 'Rated B', 'Unrated', 'Other'],
+        'genre': ['Drama', 'Sci-Fi', 'Sci-Fi', 'Sci-Fi', 'Drama'],
+        'description': ['family story', 'space station', 'space alien', 'space colony', 'family feud'],
+        'rating': [7.0, 7.5, 9.0, np.nan, 6.0],
+        'year': [2001, 2002, 2003, 2004, 2005],
+        'image_url': '',
+    })
+    interactions = pd.DataFrame({
+        'id': [1], 'user_id': [1], 'movie_id': [1], 'interaction_type': ['like'],
+        'watch_time': [0], 'timestamp': ['2024-01-01 00:00:00'],
+    })
+    rec = Recommender.from_frames(movies, interactions)
+    # Profile store loaded from a scratch database instead of netflix_rec.db
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE user_genre_profile (user_id INTEGER, genre TEXT, score REAL)')
+    conn.executemany('INSERT INTO user_genre_profile VALUES (1, ?, ?)', [('Drama', 10), ('Sci-Fi', 5)])
+    rec.profiles.load(conn)
+    # Score on the in-memory model (the facade would refresh from the database)
+    recs = rec.model.get_hybrid_recommendations(1)
+    print(f"  Order: {[(m['title'], m.get('match_score')) for m in recs]}")
+
+    unrated = next(m for m in recs if m['id'] == 4)
+    # A missing rating counts as 0: 50% match, no boost
+    assert unrated['match_score'] == 50, unrated['match_score']
+    assert [m['id'] for m in recs][-1] == 4, "unrated movie must rank below the rated matches"
+    assert unrated['rating'] is None
+    # Responses must stay valid JSON (no NaN)
+    json.dumps(recs, allow_nan=False)
+    print("SUCCESS: Unrated movie scored without a rating boost.")
+
+if __name__ == "__main__":
+    test_unrated_candidate()